@@ -0,0 +1,263 @@
+import functools
+from abc import ABC, abstractmethod
+
+from payment_history import PaymentHistoryEncoder, days_past_due_summary
+
+# Aggregates computed over a mapped list (e.g. accounts) in `aggregate:`
+# rules. An aggregate sees one item at a time through add(), so every
+# aggregate over the same list shares a single pass; values several
+# aggregates need (SHARED) are computed once per item in that pass (see
+# mapping_engine.AggregatePlan).
+
+# Function name as written in step files -> Aggregate class
+AGGREGATES = {}
+
+# Shared value name -> function of an item
+SHARED = {}
+
+# Where compactPaymentHistory puts the packed history in experian_normalize
+PACKED_HISTORY_FIELD = 'paymentHistoryYearly'
+
+def aggregate(name):
+    def decorator(cls):
+        AGGREGATES[name] = cls
+        return cls
+    return decorator
+
+def shared(name):
+    def decorator(fn):
+        SHARED[name] = fn
+        return fn
+    return decorator
+
+@functools.lru_cache(maxsize=4096)
+def month_index(date):
+    """'2019-03-15' -> months since year 0, None for missing dates"""
+    if not date:
+        return None
+    return int(date[:4]) * 12 + int(date[5:7]) - 1
+
+def percent(part, whole, digits=2):
+    return round(part * 100 / whole, digits) if whole else None
+
+@shared('utilization')
+def utilization(item):
+    """Balance as a percent of the credit limit, for accounts with a limit"""
+    limit = item.get('creditLimit')
+    if not limit or limit <= 0:
+        return None
+    return percent(item.get('currentBalance') or 0, limit)
+
+@shared('openedMonth')
+def opened_month(item):
+    return month_index(item.get('openDate'))
+
+@shared('reportedMonth')
+def reported_month(item):
+    return month_index(item.get('dateReported'))
+
+class Aggregate(ABC):
+    """Fold over the items of a list.
+
+    `field` is set when the rule projects a field of the items (as in
+    count_by_account_type(accounts.accountType)); `params` are the rule's
+    remaining literal arguments. add() gets each item with a dict of the
+    SHARED values named in `uses`.
+    """
+
+    uses = ()
+
+    def __init__(self, field=None, *params):
+        self.field = field
+        self.params = params
+
+    @abstractmethod
+    def add(self, item, values):
+        """Fold in one item"""
+
+    @abstractmethod
+    def result(self):
+        """The aggregate's value after the last item"""
+
+@aggregate('count_by_account_type')
+class CountByAccountType(Aggregate):
+    def __init__(self, field=None, *params):
+        super().__init__(field or 'accountType', *params)
+        self.counts = {}
+
+    def add(self, item, values):
+        key = item.get(self.field)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def result(self):
+        return self.counts
+
+@aggregate('weighted_utilization')
+class WeightedUtilization(Aggregate):
+    uses = ('utilization',)
+
+    def __init__(self, field=None, *params):
+        super().__init__(field, *params)
+        self.balance = 0
+        self.limit = 0
+
+    def add(self, item, values):
+        if values['utilization'] is not None:
+            self.balance += item.get('currentBalance') or 0
+            self.limit += item.get('creditLimit')
+
+    def result(self):
+        return percent(self.balance, self.limit)
+
+@aggregate('per_account_utilization')
+class PerAccountUtilization(Aggregate):
+    uses = ('utilization',)
+
+    def __init__(self, field=None, *params):
+        super().__init__(field, *params)
+        self.accounts = []
+
+    def add(self, item, values):
+        value = values['utilization']
+        if value is not None:
+            self.accounts.append({"accountId": item.get('accountId'),
+                                  "lenderName": item.get('lenderName'),
+                                  "utilizationPercent": value})
+
+    def result(self):
+        return self.accounts
+
+@aggregate('high_util_accounts')
+class HighUtilizationAccounts(Aggregate):
+    uses = ('utilization',)
+
+    def __init__(self, field=None, threshold=75, *params):
+        super().__init__(field, threshold, *params)
+        self.threshold = threshold
+        self.accounts = []
+
+    def add(self, item, values):
+        value = values['utilization']
+        if value is not None and value >= self.threshold:
+            self.accounts.append(item.get('accountId'))
+
+    def result(self):
+        return self.accounts
+
+class DatedAggregate(Aggregate):
+    """Aggregates measured against the report's as-of month: the latest
+    dateReported among the items"""
+
+    uses = ('reportedMonth', 'openedMonth')
+
+    def __init__(self, field=None, *params):
+        super().__init__(field, *params)
+        self.as_of = None
+        self.opened = []
+
+    def add(self, item, values):
+        reported = values['reportedMonth']
+        if reported is not None and (self.as_of is None or reported > self.as_of):
+            self.as_of = reported
+        opened = values['openedMonth']
+        if opened is not None:
+            self.opened.append(opened)
+
+@aggregate('age_of_credit_stats')
+class AgeOfCredit(DatedAggregate):
+    def __init__(self, field=None, *params):
+        super().__init__(field, *params)
+        self.oldest = None
+        self.newest = None
+
+    def add(self, item, values):
+        super().add(item, values)
+        opened = item.get('openDate')
+        if opened:
+            self.oldest = opened if self.oldest is None else min(self.oldest, opened)
+            self.newest = opened if self.newest is None else max(self.newest, opened)
+
+    def result(self):
+        average = None
+        if self.opened and self.as_of is not None:
+            average = round(sum(self.as_of - m for m in self.opened) / len(self.opened), 1)
+        return {"oldestAccountDate": self.oldest, "newestAccountDate": self.newest,
+                "averageAgeMonths": average}
+
+@aggregate('recent_activity')
+class RecentActivity(DatedAggregate):
+    def __init__(self, field=None, *params):
+        super().__init__(field, *params)
+        self.closed = []
+
+    def add(self, item, values):
+        super().add(item, values)
+        closed = month_index(item.get('closeDate'))
+        if closed is not None:
+            self.closed.append(closed)
+
+    def result(self):
+        if self.as_of is None:
+            return {"accountsOpenedLast6Months": None, "accountsOpenedLast12Months": None,
+                    "accountsClosedLast12Months": None}
+        return {
+            "accountsOpenedLast6Months": sum(self.as_of - m < 6 for m in self.opened),
+            "accountsOpenedLast12Months": sum(self.as_of - m < 12 for m in self.opened),
+            "accountsClosedLast12Months": sum(self.as_of - m < 12 for m in self.closed),
+        }
+
+@aggregate('payment_behavior')
+class PaymentBehavior(Aggregate):
+    """Monthly payment record, read from the packed paymentHistoryYearly
+    when present and from paymentHistory rows otherwise.
+
+    Rows are packed first, so both give the same record: months outside
+    1..12 and rows without a year are skipped, a repeated month counts
+    once (its last row) and days past due are clamped to 0 and above.
+    """
+
+    # Field names of mapped paymentHistory rows
+    ROWS = PaymentHistoryEncoder({'year': 'year', 'month': 'month', 'daysPastDue': 'daysPastDue'})
+
+    def __init__(self, field=None, *params):
+        super().__init__(field or 'paymentHistory', *params)
+        self.months = 0
+        self.on_time = 0
+        self.max_days_past_due = 0
+
+    def add(self, item, values):
+        packed = item.get(PACKED_HISTORY_FIELD)
+        if packed is not None:
+            months, on_time, most = days_past_due_summary(packed)
+        else:
+            rows = item.get(self.field)
+            months, on_time, most = days_past_due_summary(self.ROWS.encode(rows) if rows else None)
+        self.months += months
+        self.on_time += on_time
+        self.max_days_past_due = max(self.max_days_past_due, most)
+
+    def result(self):
+        return {"totalMonths": self.months, "onTimeMonths": self.on_time,
+                "onTimePercent": percent(self.on_time, self.months),
+                "maxDaysPastDue": self.max_days_past_due}
+
+@aggregate('delinquency_summary')
+class DelinquencySummary(Aggregate):
+    # accountStatus values (see transform_functions.ACCOUNT_STATUSES)
+    COUNTED = {'DELINQUENT': 'delinquentAccounts', 'WRITTEN_OFF': 'writtenOffAccounts',
+               'SETTLED': 'settledAccounts', 'SUIT_FILED': 'suitFiledAccounts'}
+
+    def __init__(self, field=None, *params):
+        super().__init__(field, *params)
+        self.counts = dict.fromkeys(self.COUNTED.values(), 0)
+        self.ever_delinquent = 0
+
+    def add(self, item, values):
+        key = self.COUNTED.get(item.get('accountStatus'))
+        if key:
+            self.counts[key] += 1
+        if item.get('dateOfFirstDelinquency'):
+            self.ever_delinquent += 1
+
+    def result(self):
+        return {**self.counts, "everDelinquentAccounts": self.ever_delinquent}
@@ -0,0 +1,156 @@
+import argparse
+import copy
+import datetime
+import json
+import random
+import time
+
+import lazy_json
+import transform_functions
+import yaml_loader
+from mapping_engine import AggregatePlan, ResponseMapping
+from payment_history import json_default
+
+DATE_FIELDS = (
+    'Open_Date', 'Date_Closed', 'Date_Reported', 'DateOfAddition', 'Date_of_Last_Payment',
+    'Date_of_First_Delinquency', 'DefaultStatusDate', 'LitigationStatusDate', 'WriteOffStatusDate',
+)
+
+def ymd(day):
+    return int(day.strftime('%Y%m%d'))
+
+def synthetic_report(accounts=300, history=36, seed=0):
+    """A bureau payload shaped like the ones experian_normalize maps"""
+    rng = random.Random(seed)
+    report_day = datetime.date(2024, 6, 30)
+    # Bureaus repeat a modest set of dates across accounts
+    pool = [ymd(report_day - datetime.timedelta(days=rng.randrange(3650))) for _ in range(200)]
+
+    details = []
+    for number in range(accounts):
+        account = {field: rng.choice(pool + [None, '']) for field in DATE_FIELDS}
+        account.update({
+            'Date_Reported': ymd(report_day),
+            'Identification_Number': f'ACC{number:05d}',
+            'Subscriber_Name': rng.choice(['HDFC BANK', 'ICICI BANK', 'SBI', 'BAJAJ FIN']),
+            'Account_Number': f'XXXX{rng.randrange(10000):04d}',
+            'Portfolio_Type': rng.choice('IRMO'),
+            'Account_Type': rng.choice(['1', '2', '5', '10', '13']),
+            'Highest_Credit_or_Original_Loan_Amount': str(rng.randrange(10000, 2000000)),
+            'Current_Balance': str(rng.randrange(0, 1500000)),
+            'Credit_Limit_Amount': rng.choice(['', str(rng.randrange(50000, 500000))]),
+            'Account_Status': rng.choice(['11', '13', '71', '78']),
+            'Rate_of_Interest': rng.choice(['', '10.5', '14.25']),
+            'Repayment_Tenure': rng.choice(['0', '12', '36', '60']),
+            'CAIS_Account_History': [
+                {'Year': str(2024 - month // 12), 'Month': str(12 - month % 12),
+                 'Days_Past_Due': rng.choice(['0', '0', '0', '30', '60', '']),
+                 'Asset_Classification': rng.choice(['S', '?'])}
+                for month in range(history)
+            ],
+        })
+        details.append(account)
+
+    return {'data': {'credit_score': 760, 'name': 'Test Customer', 'report': {
+        'CreditProfileHeader': {'ReportNumber': '1718000000000', 'ReportDate': ymd(report_day)},
+        'SCORE': {'FCIREXScore': '760'},
+        'CAIS_Account': {
+            'CAIS_Summary': {
+                'Credit_Account': {'CreditAccountTotal': str(accounts), 'CreditAccountActive': '1',
+                                   'CreditAccountClosed': '0', 'CreditAccountDefault': '0'},
+                'Total_Outstanding_Balance': {'Outstanding_Balance_All': '150000',
+                                              'Outstanding_Balance_Secured': '100000',
+                                              'Outstanding_Balance_UnSecured': '50000'},
+            },
+            'CAIS_Account_DETAILS': details,
+        },
+        'NonCreditCAPS': {'CAPS_Application_Details': [
+            {'ReportNumber': str(n), 'Subscriber_Name': 'NBFC', 'Date_of_Request': rng.choice(pool),
+             'Enquiry_Reason': '5', 'Amount_Financed': '50000'} for n in range(5)
+        ]},
+    }}}
+
+def time_per_run(fn, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started) / runs * 1000
+
+def report_dates(payload):
+    details = payload['data']['report']['CAIS_Account']['CAIS_Account_DETAILS']
+    return [account.get(field) for account in details for field in DATE_FIELDS]
+
+def main():
+    parser = argparse.ArgumentParser(description="Time bureau report normalization")
+    parser.add_argument('--step', default='steps/business/experian_normalize.yaml')
+    parser.add_argument('--accounts', type=int, default=300)
+    parser.add_argument('--history', type=int, default=36, help="history rows per account")
+    parser.add_argument('--reports', type=int, default=20, help="reports timed per measurement")
+    args = parser.parse_args()
+
+    step = yaml_loader.load_file(args.step)
+    mapping = ResponseMapping(step['params']['response'])
+    payloads = [synthetic_report(args.accounts, args.history, seed) for seed in range(args.reports)]
+    dates = [report_dates(payload) for payload in payloads]
+    uncached = transform_functions.parse_date_yyyymmdd.__wrapped__
+
+    print(f"📊 {args.reports} reports x {args.accounts} accounts x {args.history} history rows")
+    print(f"📅 {len(dates[0])} raw dates per report")
+
+    def each_report(fn, inputs):
+        items = iter(inputs)
+        return lambda: fn(next(items))
+
+    transform_functions.parse_date_yyyymmdd.cache_clear()
+    timings = [
+        ("dates, uncached", lambda column: [uncached(v) for v in column], dates),
+        ("dates, LRU per value",
+         lambda column: [transform_functions.normalize_date_yyyymmdd(v) for v in column], dates),
+        ("dates, column call", transform_functions.normalize_date_column, dates),
+        ("full normalize", mapping.apply, payloads),
+    ]
+    for label, fn, inputs in timings:
+        ms = time_per_run(each_report(fn, inputs), args.reports)
+        print(f"   ⏱️  {label:<22} {ms:8.3f} ms/report")
+
+    # Aggregates alone, over already normalized reports
+    actions = step['params']['response'][0]['actions']
+    list_names = [rule['to'] for rule in actions.get('map_lists') or ()]
+    rules = actions.get('aggregate') or []
+    fused = AggregatePlan(rules, list_names)
+    separate = [AggregatePlan([rule], list_names) for rule in rules]
+    outputs = [mapping.apply(payload) for payload in payloads]
+
+    def one_pass_each(pair):
+        for plan in separate:
+            plan.apply(*pair)
+
+    # Packed payment history against plain history rows
+    rows_rules = copy.deepcopy(step['params']['response'])
+    for rule in rows_rules[0]['actions'].get('map_lists') or ():
+        compact = (rule.get('item') or {}).get('compactPaymentHistory')
+        if compact:
+            compact['enabled'] = False
+    rows_mapping = ResponseMapping(rows_rules)
+    ms = time_per_run(each_report(rows_mapping.apply, payloads), args.reports)
+    print(f"   ⏱️  {'normalize, history rows':<22} {ms:8.3f} ms/report")
+    packed_size = len(json.dumps(outputs[0], default=json_default))
+    rows_size = len(json.dumps(rows_mapping.apply(payloads[0])))
+    print(f"📦 Stored payload: {packed_size} bytes packed, {rows_size} bytes with history rows")
+
+    pairs = list(zip(outputs, payloads))
+    for label, fn in (("aggregates, fused", lambda pair: fused.apply(*pair)),
+                      ("aggregates, pass each", one_pass_each)):
+        ms = time_per_run(each_report(fn, pairs), args.reports)
+        print(f"   ⏱️  {label:<22} {ms:8.3f} ms/report")
+    # Stored report blobs, decoded whole and as far as the mapping reads
+    blobs = [json.dumps(payload) for payload in payloads]
+    selection = lazy_json.Selection.from_paths(mapping.source_paths())
+    for label, fn in (("rres, json.loads", json.loads),
+                      ("rres, lazy_json", lambda blob: lazy_json.decode(blob, selection))):
+        ms = time_per_run(each_report(fn, blobs), args.reports)
+        print(f"   ⏱️  {label:<22} {ms:8.3f} ms/report")
+    print(f"🗃️  Date cache: {transform_functions.date_cache_info()}")
+
+if __name__ == "__main__":
+    main()
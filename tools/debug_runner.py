@@ -3,6 +3,10 @@ import re
 import time
 import json
 
+import yaml
+
+import yaml_loader
+
 def safe_str(value):
     """Safely convert any value to string"""
     if isinstance(value, list):
@@ -24,9 +28,39 @@ class UltraRobustWorkflowRunner:
         self.parse_workflow()
         
     def parse_workflow(self):
-        """Parse workflow file line by line to avoid all YAML issues"""
+        """Parse workflow file with the !include-aware YAML loader"""
         print("🔍 Debug: Starting workflow parsing...")
-        
+
+        try:
+            route = yaml_loader.load_file(self.workflow_file) or {}
+        except yaml.YAMLError as e:
+            print(f"   ⚠️  YAML parsing failed, scanning lines instead: {e}")
+            self.scan_workflow_lines()
+            return
+
+        for key in ('path', 'method', 'response'):
+            if key in route:
+                self.workflow[key] = route[key]
+                print(f"   ✓ Found {key}: {route[key]}")
+
+        for entry in route.get('steps') or []:
+            if not isinstance(entry, yaml_loader.Include):
+                print(f"   ⚠️  Skipping non-include step: {entry!r}")
+                continue
+            step_info = {
+                'number': len(self.steps) + 1,
+                'include_path': entry.path,
+                'line_number': entry.line,
+                'query': entry.query,
+                'args': entry.args
+            }
+            self.steps.append(step_info)
+            print(f"   ✓ Found include: {entry.path} (query={entry.query}, args={entry.args})")
+
+        print(f"🎯 Parsing complete: Found {len(self.steps)} steps")
+
+    def scan_workflow_lines(self):
+        """Parse workflow file line by line to avoid all YAML issues"""
         with open(self.workflow_file, 'r', encoding='utf-8') as file:
             lines = file.readlines()
         
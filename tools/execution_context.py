@@ -0,0 +1,83 @@
+import sys
+
+# Value of a context slot nothing has written yet
+MISSING = object()
+
+class ContextLayout:
+    """Slot numbers for the context keys of a compiled route.
+
+    Every key a step reads or writes gets a fixed slot (its handle) when
+    the plan is compiled; `reads[i]` and `writes[i]` hold the handles of
+    step i, so running a step needs no key lookups at all.
+    """
+
+    __slots__ = ('names', 'index', 'reads', 'writes')
+
+    def __init__(self, graph):
+        names = set()
+        for node in graph:
+            names |= node.keys.reads | node.keys.writes
+        self.names = tuple(sys.intern(name) for name in sorted(names))
+        self.index = {name: handle for handle, name in enumerate(self.names)}
+        self.reads = tuple(self.handles(node.keys.reads) for node in graph)
+        self.writes = tuple(self.handles(node.keys.writes) for node in graph)
+
+    def handles(self, names):
+        return tuple(sorted(self.index[name] for name in names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getstate__(self):
+        return (self.names, self.reads, self.writes)
+
+    def __setstate__(self, state):
+        names, self.reads, self.writes = state
+        self.names = tuple(sys.intern(name) for name in names)
+        self.index = {name: handle for handle, name in enumerate(self.names)}
+
+class ExecutionContext:
+    """Values steps pass to each other during one execution.
+
+    Values live in a flat list indexed by ContextLayout handles. snapshot()
+    returns a context sharing that list; whichever side writes first takes
+    its own copy, so a branch can run against a stable view of its inputs
+    and have only its outputs merged back.
+    """
+
+    __slots__ = ('layout', 'values', 'shared')
+
+    def __init__(self, layout, values=None):
+        self.layout = layout
+        self.shared = values is not None
+        self.values = values if values is not None else [MISSING] * len(layout)
+
+    def get(self, handle, default=None):
+        value = self.values[handle]
+        return default if value is MISSING else value
+
+    def set(self, handle, value):
+        if self.shared:
+            self.values = list(self.values)
+            self.shared = False
+        self.values[handle] = value
+
+    def snapshot(self):
+        self.shared = True
+        return ExecutionContext(self.layout, self.values)
+
+    def merge(self, other, handles):
+        """Copy the given slots from another context (e.g. a finished branch)"""
+        for handle in handles:
+            value = other.values[handle]
+            if value is not MISSING:
+                self.set(handle, value)
+
+    def get_key(self, name, default=None):
+        """Look up a value by key name (slower than get())"""
+        handle = self.layout.index.get(name)
+        return default if handle is None else self.get(handle, default)
+
+    def as_dict(self):
+        return {name: value for name, value in zip(self.layout.names, self.values)
+                if value is not MISSING}
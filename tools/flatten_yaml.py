@@ -1,19 +1,28 @@
 #!/usr/bin/env python3
+import argparse
+import glob
+import hashlib
+import json
 import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Input/Output
+from text_normalize import normalize_line, normalize_spaces
+
+# Default Input/Output when no routes are given on the command line
 # If you ran a normalizer first, set INPUT = 'routes/fetch_br_norm.yaml'
 # Otherwise, point directly to your original routes file:
 INPUT = 'routes/fetch_br_norm.yaml'
 OUTPUT = 'dist/fetch_br_flat.yaml'
+# With --normalize the original route is normalized while it is flattened
+RAW_INPUT = 'routes/fetch_br.yaml'
+ROUTES_DIR = 'routes'
+DIST_DIR = 'dist'
 
-os.makedirs(os.path.dirname(OUTPUT), exist_ok=True)
-
-# Common Unicode spaces that sometimes sneak in from editors/copy-paste
-NBSP = '\u00A0'    # non-breaking space
-FIGSP = '\u2007'   # figure space
-NNBSP = '\u202F'   # narrow no-break space
+# Dependency manifests are written next to each output as <output>.deps.json
+MANIFEST_SUFFIX = '.deps.json'
+MANIFEST_FORMAT = 3
 
 def read_file(p: str) -> str:
     with open(p, 'r', encoding='utf-8') as f:
@@ -23,10 +32,6 @@ def write_file(p: str, s: str) -> None:
     with open(p, 'w', encoding='utf-8') as f:
         f.write(s)
 
-def normalize_spaces(text: str) -> str:
-    # Normalize known unicode spaces to regular spaces
-    return text.replace(NBSP, ' ').replace(FIGSP, ' ').replace(NNBSP, ' ')
-
 def resolve_include_path(base_dir: str, include_expr: str) -> str:
     s = include_expr.strip()
     # Optional "file:" prefix
@@ -52,114 +57,405 @@ def indent_block(text: str, spaces: int) -> str:
 # - capture everything after (we'll sanitize below)
 INCLUDE_RE = re.compile(r'^(\s*)-\s*!include\s+(?:file:\s*)?(.+?)\s*$')
 
-def flatten(input_file: str) -> str:
-    base_dir = os.getcwd()
-    src = normalize_spaces(read_file(input_file))
-    lines = src.split('\n')
+def read_lines(p: str):
+    """Yield the lines of a file without their newlines, one at a time.
 
-    out = []
-    i = 0
-    n = len(lines)
+    Matches str.split('\\n'): a file ending in a newline yields a final ''.
+    """
+    with open(p, 'r', encoding='utf-8') as f:
+        line = ''
+        for line in f:
+            yield line[:-1] if line.endswith('\n') else line
+        if not line or line.endswith('\n'):
+            yield ''
 
-    while i < n:
-        line = lines[i]
-        m = INCLUDE_RE.match(line)
+def include_target(raw_target: str) -> str:
+    """Extract the include path from whatever follows !include on a line"""
+    # Drop any inline comments
+    hash_pos = raw_target.find('#')
+    if hash_pos != -1:
+        raw_target = raw_target[:hash_pos]
+    raw_target = raw_target.strip()
 
-        if not m:
-            out.append(line)
-            i += 1
-            continue
+    # Strip inline query params if present
+    qpos = raw_target.find('?')
+    if qpos != -1:
+        path_part = raw_target[:qpos].strip()
+    else:
+        path_part = raw_target
 
-        indent = m.group(1)
+    # Strip an optional file: prefix if it still exists
+    if path_part.lower().startswith('file:'):
+        path_part = path_part[5:].strip()
 
-        # Extract and sanitize the include target (path + optional query/comments)
-        raw_target = m.group(2)  # whatever comes after !include on the same line
+    # Keep only the path ending with .yml/.yaml if additional junk is present
+    m_path = re.search(r'([^\s]+\.ya?ml)', path_part)
+    if m_path:
+        return m_path.group(1)
+    return path_part
 
-        # Drop any inline comments
-        hash_pos = raw_target.find('#')
-        if hash_pos != -1:
-            raw_target = raw_target[:hash_pos]
-        raw_target = raw_target.strip()
+def inline_include(indent: str, inc_content: str):
+    """Yield the lines of an included file as a list item at `indent`"""
+    inc_lines = inc_content.split('\n')
 
-        # Strip inline query params if present
-        qpos = raw_target.find('?')
-        if qpos != -1:
-            path_part = raw_target[:qpos].strip()
-        else:
-            path_part = raw_target
+    # Skip leading blank lines in the included file
+    first_idx = 0
+    while first_idx < len(inc_lines) and not inc_lines[first_idx].strip():
+        first_idx += 1
 
-        # Strip an optional file: prefix if it still exists
-        if path_part.lower().startswith('file:'):
-            path_part = path_part[5:].strip()
+    dash = indent + '- '
+    first_line = inc_lines[first_idx] if first_idx < len(inc_lines) else ''
 
-        # Keep only the path ending with .yml/.yaml if additional junk is present
-        m_path = re.search(r'([^\s]+\.ya?ml)', path_part)
-        if m_path:
-            include_rel_path = m_path.group(1)
-        else:
-            include_rel_path = path_part
+    # If first line looks like "key:" start, inline it nicely as a list item
+    if re.match(r'^\s*[\w\-\"]+\s*:', first_line):
+        yield dash + first_line.strip()
+        rest = '\n'.join(inc_lines[first_idx + 1:])
+        if rest.strip():
+            yield from indent_block(rest, len(indent) + 2).split('\n')
+    else:
+        # Fallback: include as a literal block to avoid YAML breakage
+        yield dash + '|'
+        yield from indent_block(inc_content, len(indent) + 2).split('\n')
+
+def make_cache(normalize: bool = False) -> 'IncludeCache':
+    """Include cache for a plain flatten, or for the fused normalize+flatten
+    pass that also strips trailing whitespace"""
+    return IncludeCache(normalize_line if normalize else normalize_spaces)
+
+class IncludeCycleError(ValueError):
+    pass
+
+class IncludeCache:
+    """Expanded include contents for one flatten run, keyed by resolved path.
+
+    Each file is read, normalized and expanded once no matter how many
+    routes or steps include it; missing files are remembered as None.
+    `dependencies` holds every file (transitively) included by each path.
+    `normalize` is applied to every line read, route and includes alike.
+    """
+
+    def __init__(self, normalize=normalize_spaces):
+        self.normalize = normalize
+        self.expanded = {}
+        self.dependencies = {}
+        self.reads = 0
+
+    def expand(self, inc_path: str, base_dir: str, stack=()):
+        if inc_path in stack:
+            chain = ' -> '.join(stack + (inc_path,))
+            raise IncludeCycleError(f'Include cycle: {chain}')
+        if inc_path in self.expanded:
+            return self.expanded[inc_path]
+
+        content = None
+        deps = set()
+        if os.path.exists(inc_path):
+            self.reads += 1
+            lines = read_file(inc_path).split('\n')
+            content = '\n'.join(iter_flatten(lines, base_dir, self, stack + (inc_path,), deps))
+        self.expanded[inc_path] = content
+        self.dependencies[inc_path] = frozenset(deps)
+        return content
+
+def iter_flatten(lines, base_dir: str, cache=None, stack=(), deps=None):
+    """Yield flattened output lines for an iterable of route lines.
+
+    Input is consumed lazily with one line of lookahead (for args: blocks),
+    so memory use does not grow with the size of the route. Includes are
+    expanded recursively through `cache`; `stack` holds the files being
+    expanded and is used to detect cycles. Every included path, found or
+    not, is added to `deps` when given.
+    """
+    if cache is None:
+        cache = IncludeCache()
+    normalize = cache.normalize
+    lines = iter(lines)
+    pending = next(lines, None)
+
+    while pending is not None:
+        line = normalize(pending)
+        pending = next(lines, None)
+        m = INCLUDE_RE.match(line)
+
+        if not m:
+            yield line
+            continue
+
+        indent = m.group(1)
+        include_rel_path = include_target(m.group(2))
 
         # Collect args: block that follows (same indent level + at least one more space)
         args_lines = []
-        j = i + 1
         next_indent_re = re.compile(r'^' + re.escape(indent) + r'\s+')
-        if j < n and next_indent_re.match(lines[j]) and lines[j].lstrip().startswith('args:'):
-            args_lines.append(lines[j])
-            j += 1
-            while j < n and next_indent_re.match(lines[j]):
-                args_lines.append(lines[j])
-                j += 1
-
-        # Resolve and read included file
+        if pending is not None:
+            candidate = normalize(pending)
+            if next_indent_re.match(candidate) and candidate.lstrip().startswith('args:'):
+                while pending is not None and next_indent_re.match(candidate):
+                    args_lines.append(candidate)
+                    pending = next(lines, None)
+                    candidate = normalize(pending) if pending is not None else ''
+
+        # Resolve and expand included file
         inc_path = resolve_include_path(base_dir, include_rel_path)
-        # print(f"DEBUG resolved include: {include_rel_path} -> {inc_path} (exists={os.path.exists(inc_path)})")
+        inc_content = cache.expand(inc_path, base_dir, stack)
+        if deps is not None:
+            deps.add(inc_path)
+            deps.update(cache.dependencies[inc_path])
 
-        if not os.path.exists(inc_path):
+        if inc_content is None:
             # If missing, keep original include and args block
-            out.append(line)
+            yield line
+            yield from args_lines
+            continue
+
+        yield from inline_include(indent, inc_content)
+
+        # Preserve args as comments (for traceability)
+        if args_lines:
+            yield indent + '  # ---- args (preserved for reference) ----'
             for a in args_lines:
-                out.append(a)
-            i = j
+                yield indent + '  # ' + a.strip()
+
+def flatten(input_file: str, cache=None, normalize=False) -> str:
+    if cache is None:
+        cache = make_cache(normalize)
+    stack = (os.path.normpath(os.path.abspath(input_file)),)
+    return '\n'.join(iter_flatten(read_lines(input_file), os.getcwd(), cache, stack))
+
+def flatten_stream(input_file: str, output_file: str, cache=None, deps=None,
+                   normalize=False) -> None:
+    """Flatten input_file into output_file, writing each line as it is produced.
+
+    Pass one IncludeCache to several calls to share include expansions, and
+    a set as `deps` to collect the included files. With normalize=True (or
+    a make_cache(True) cache) the route is normalized in the same pass, so
+    no intermediate _norm file is needed.
+    """
+    if cache is None:
+        cache = make_cache(normalize)
+    out_dir = os.path.dirname(output_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    # Write next to the destination and swap in, so a failed run (e.g. an
+    # include cycle) never leaves a truncated output behind
+    tmp_file = f'{output_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as out:
+            separator = ''
+            stack = (os.path.normpath(os.path.abspath(input_file)),)
+            for line in iter_flatten(read_lines(input_file), os.getcwd(), cache, stack, deps):
+                out.write(separator)
+                out.write(line)
+                separator = '\n'
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def manifest_path(output_file: str) -> str:
+    return output_file + MANIFEST_SUFFIX
+
+def file_digest(path: str):
+    """sha256 of a file, or None when it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def file_record(path: str) -> dict:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {'mtime_ns': None, 'size': None, 'sha256': None}
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha256': file_digest(path)}
+
+def write_manifest(input_file: str, output_file: str, deps, normalize=False) -> None:
+    paths = {os.path.relpath(p) for p in deps} | {os.path.relpath(input_file)}
+    manifest = {
+        'format': MANIFEST_FORMAT,
+        'normalize': normalize,
+        'input': os.path.relpath(input_file),
+        'output': os.path.relpath(output_file),
+        'dependencies': {p: file_record(p) for p in sorted(paths)},
+    }
+    with open(manifest_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+def is_up_to_date(input_file: str, output_file: str, normalize=False) -> bool:
+    """True when output_file was built from the same input and includes.
+
+    Files whose mtime or size moved are re-hashed, so a touch alone does not
+    force a rebuild.
+    """
+    if not os.path.exists(output_file):
+        return False
+    try:
+        with open(manifest_path(output_file), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if (manifest.get('format') != MANIFEST_FORMAT
+            or manifest.get('normalize') != normalize
+            or manifest.get('input') != os.path.relpath(input_file)):
+        return False
+
+    for path, recorded in manifest.get('dependencies', {}).items():
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if recorded.get('sha256') is not None:
+                return False
+            continue
+        if (st.st_mtime_ns, st.st_size) == (recorded.get('mtime_ns'), recorded.get('size')):
             continue
+        if recorded.get('sha256') is None or file_digest(path) != recorded['sha256']:
+            return False
+    return True
 
-        inc_content = normalize_spaces(read_file(inc_path))
-        inc_lines = inc_content.split('\n')
+def build(input_file: str, output_file: str, cache=None, force=False, normalize=False) -> bool:
+    """Flatten input_file unless its manifest shows nothing changed.
 
-        # Skip leading blank lines in the included file
-        first_idx = 0
-        while first_idx < len(inc_lines) and not inc_lines[first_idx].strip():
-            first_idx += 1
+    Returns True when the output was (re)written.
+    """
+    if cache is None:
+        cache = make_cache(normalize)
+    if not force and is_up_to_date(input_file, output_file, normalize):
+        return False
+    deps = set()
+    flatten_stream(input_file, output_file, cache, deps)
+    write_manifest(input_file, output_file, deps, normalize)
+    return True
 
-        dash = indent + '- '
-        first_line = inc_lines[first_idx] if first_idx < len(inc_lines) else ''
+def output_path(input_file: str, out_dir: str = DIST_DIR) -> str:
+    """dist/<name>_flat.yaml for routes/<name>.yaml or routes/<name>_norm.yaml"""
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    if stem.endswith('_norm'):
+        stem = stem[:-len('_norm')]
+    return os.path.join(out_dir, stem + '_flat.yaml')
 
-        # If first line looks like "key:" start, inline it nicely as a list item
-        if re.match(r'^\s*[\w\-\"]+\s*:', first_line):
-            out.append(dash + first_line.strip())
-            rest = '\n'.join(inc_lines[first_idx + 1:])
-            if rest.strip():
-                out.append(indent_block(rest, len(indent) + 2))
-        else:
-            # Fallback: include as a literal block to avoid YAML breakage
-            out.append(dash + '|')
-            out.append(indent_block(inc_content, len(indent) + 2))
+def discover_routes(routes_dir: str = ROUTES_DIR, out_dir: str = DIST_DIR, normalize=False):
+    """Map every output file to the route that builds it.
 
-        # Preserve args as comments (for traceability)
-        if args_lines:
-            out.append(indent + '  # ---- args (preserved for reference) ----')
-            for a in args_lines:
-                out.append(indent + '  # ' + a.strip())
+    A normalized route (<name>_norm.yaml) and its original flatten to the
+    same output; the _norm file wins, unless `normalize` is set, in which
+    case the original is normalized on the fly.
+    """
+    jobs = {}
+    for route in sorted(glob.glob(os.path.join(routes_dir, '*.yaml'))):
+        out = output_path(route, out_dir)
+        if out not in jobs or route.endswith('_norm.yaml') != normalize:
+            jobs[out] = route
+    return [(route, out) for out, route in sorted(jobs.items())]
 
-        i = j
+# Include cache shared by all jobs handled by one worker process
+_worker_cache = None
 
-    return '\n'.join(out)
+def _init_worker(normalize=False):
+    global _worker_cache
+    _worker_cache = make_cache(normalize)
 
-if __name__ == '__main__':
-    # Ensure input exists
-    if not os.path.exists(INPUT):
-        print(f'❌ Input file not found: {INPUT}')
+def flatten_job(input_file: str, output_file: str, force=False, normalize=False):
+    """Build one route; returns (input, output, seconds, built). Runs in a worker."""
+    started = time.perf_counter()
+    built = build(input_file, output_file, _worker_cache, force, normalize)
+    return input_file, output_file, time.perf_counter() - started, built
+
+def flatten_all(jobs, workers=None, force=False, normalize=False):
+    """Build (input, output) pairs across a process pool.
+
+    Routes whose manifest is current are checked up front and never reach
+    the pool. Yields (input, output, seconds, built, error) per job.
+    """
+    if not force:
+        stale = []
+        for src, dst in jobs:
+            if is_up_to_date(src, dst, normalize):
+                yield src, dst, 0.0, False, None
+            else:
+                stale.append((src, dst))
+        jobs = stale
+    if not jobs:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(normalize,)) as pool:
+        futures = {pool.submit(flatten_job, src, dst, True, normalize): (src, dst)
+                   for src, dst in jobs}
+        for future in as_completed(futures):
+            src, dst = futures[future]
+            try:
+                _, _, seconds, built = future.result()
+                yield src, dst, seconds, built, None
+            except Exception as e:
+                yield src, dst, 0.0, False, e
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inline !include steps into flat route files")
+    parser.add_argument('inputs', nargs='*', help=f"route files (default: {INPUT})")
+    parser.add_argument('--all', action='store_true',
+                        help="flatten every route under --routes-dir")
+    parser.add_argument('--routes-dir', default=ROUTES_DIR)
+    parser.add_argument('--out-dir', default=DIST_DIR)
+    parser.add_argument('-o', '--output', help=f"output file for a single input (default: {OUTPUT})")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes for batch builds (default: CPU count)")
+    parser.add_argument('-f', '--force', action='store_true',
+                        help="rebuild even when the dependency manifest is current")
+    parser.add_argument('-n', '--normalize', action='store_true',
+                        help="normalize routes while flattening (no intermediate _norm file)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    if args.all:
+        jobs = discover_routes(args.routes_dir, args.out_dir, args.normalize)
+    elif args.inputs:
+        jobs = [(src, args.output if args.output and len(args.inputs) == 1
+                 else output_path(src, args.out_dir)) for src in args.inputs]
+    else:
+        jobs = [(RAW_INPUT if args.normalize else INPUT, args.output or OUTPUT)]
+
+    # Ensure inputs exist
+    missing = [src for src, _ in jobs if not os.path.exists(src)]
+    for src in missing:
+        print(f'❌ Input file not found: {src}')
+    if missing or not jobs:
+        if not jobs:
+            print(f'❌ No routes found in {args.routes_dir}/')
         raise SystemExit(1)
 
-    flat = flatten(INPUT)
-    write_file(OUTPUT, flat)
-    print(f'✅ Flattened file written to: {OUTPUT}')
\ No newline at end of file
+    if len(jobs) == 1:
+        src, dst = jobs[0]
+        try:
+            built = build(src, dst, force=args.force, normalize=args.normalize)
+        except IncludeCycleError as e:
+            print(f'❌ {e}')
+            raise SystemExit(1)
+        if built:
+            print(f'✅ Flattened file written to: {dst}')
+        else:
+            print(f'⏭️  Up to date: {dst}')
+        return
+
+    started = time.perf_counter()
+    failed = 0
+    built_count = 0
+    for src, dst, seconds, built, error in flatten_all(jobs, args.jobs, args.force, args.normalize):
+        if error:
+            failed += 1
+            print(f'❌ {src}: {error}')
+        elif built:
+            built_count += 1
+            print(f'✅ {src} -> {dst} ({seconds * 1000:.1f} ms)')
+        else:
+            print(f'⏭️  {src} -> {dst} up to date')
+    print(f'📦 {built_count} rebuilt, {len(jobs) - built_count - failed} up to date, '
+          f'{failed} failed in {time.perf_counter() - started:.2f}s')
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
+
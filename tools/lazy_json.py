@@ -0,0 +1,106 @@
+import json
+import re
+
+# orjson decodes whole documents much faster when installed
+try:
+    import orjson
+    FAST_BACKEND = True
+except ImportError:
+    orjson = None
+    FAST_BACKEND = False
+
+WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+_decoder = json.JSONDecoder()
+scanstring = json.decoder.scanstring
+
+def loads(data):
+    """Decode a whole document with the fastest available backend"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class Selection:
+    """Paths of a document that a consumer reads, as a trie.
+
+    A node is `whole` when everything below it is needed (the end of a
+    path, or a path through a list).
+    """
+
+    __slots__ = ('children', 'whole')
+
+    def __init__(self):
+        self.children = {}
+        self.whole = False
+
+    @classmethod
+    def from_paths(cls, paths):
+        root = cls()
+        for path in paths:
+            node = root
+            for key in str(path).split('.'):
+                if node.whole:
+                    break
+                node = node.children.setdefault(key, cls())
+            else:
+                node.whole = True
+                node.children = {}
+        return root
+
+def skip_ws(text, idx):
+    return WHITESPACE_RE.match(text, idx).end()
+
+def select_value(text, idx, selection):
+    """Decode the value at idx, keeping only selected object members"""
+    if selection.whole or text[idx:idx + 1] != '{':
+        return _decoder.raw_decode(text, idx)
+
+    result = {}
+    idx = skip_ws(text, idx + 1)
+    if text[idx:idx + 1] == '}':
+        return result, idx + 1
+    while True:
+        if text[idx:idx + 1] != '"':
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes",
+                                       text, idx)
+        key, idx = scanstring(text, idx + 1)
+        idx = skip_ws(text, idx)
+        if text[idx:idx + 1] != ':':
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, idx)
+        idx = skip_ws(text, idx + 1)
+
+        child = selection.children.get(key)
+        if child is None:
+            # Scanned in C and dropped at once: nothing unselected is kept
+            idx = _decoder.raw_decode(text, idx)[1]
+        else:
+            result[key], idx = select_value(text, idx, child)
+
+        idx = skip_ws(text, idx)
+        char = text[idx:idx + 1]
+        if char == '}':
+            return result, idx + 1
+        if char != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, idx)
+        idx = skip_ws(text, idx + 1)
+
+def decode(data, selection=None):
+    """Decode a JSON document; `selection` names the paths the caller reads.
+
+    With orjson the whole document is decoded: that is faster than any
+    selective scan, and readers only look at the selected paths anyway.
+    Without it, the objects along selected paths are scanned member by
+    member and every unselected member is dropped as soon as it has been
+    scanned. That costs about as much CPU as json.loads but keeps large
+    unused sections (embedded HTML reports, unused bureau segments) out
+    of memory.
+    """
+    if selection is None or orjson is not None:
+        return loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    idx = skip_ws(data, 0)
+    value, end = select_value(data, idx, selection)
+    if skip_ws(data, end) != len(data):
+        raise json.JSONDecodeError("Extra data", data, end)
+    return value
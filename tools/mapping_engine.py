@@ -0,0 +1,368 @@
+import copy
+import re
+
+from aggregates import AGGREGATES, SHARED
+from payment_history import PaymentHistoryEncoder
+from transform_functions import FUNCTIONS, apply_column
+
+# fn(arg, ...) in transform rules
+CALL_RE = re.compile(r'^\s*(\w+)\s*\((.*)\)\s*$')
+LITERALS = {'null': None, 'true': True, 'false': False}
+
+def split_path(path):
+    return tuple(str(path).split('.'))
+
+def rule_pairs(rules):
+    """(key, value) pairs of a rule list written as `- key: value` items"""
+    for rule in rules or ():
+        yield from rule.items()
+
+def make_getter(path):
+    """Function reading a dotted path from a document (None when missing)"""
+    parts = split_path(path)
+    if len(parts) == 1:
+        key = parts[0]
+        return lambda node: node.get(key) if isinstance(node, dict) else None
+
+    def get(node):
+        for key in parts:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(key)
+        return node
+    return get
+
+def make_setter(path):
+    """Function writing a value at a dotted path, creating parent objects"""
+    *parents, last = split_path(path)
+    if not parents:
+        def set_top(out, value):
+            out[last] = value
+        return set_top
+
+    def set_value(out, value):
+        node = out
+        for key in parents:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = node[key] = {}
+            node = child
+        node[last] = value
+    return set_value
+
+def parse_argument(text):
+    """A transform argument as (path, None) for a field reference or
+    (None, value) for a literal"""
+    text = text.strip()
+    if text in LITERALS:
+        return None, LITERALS[text]
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '"\'':
+        return None, text[1:-1]
+    for number in (int, float):
+        try:
+            return None, number(text)
+        except ValueError:
+            pass
+    return text, None
+
+def parse_call(expression, functions=FUNCTIONS):
+    """Split `fn(arg, ...)` into the function name and parsed arguments"""
+    match = CALL_RE.match(str(expression))
+    if not match:
+        raise ValueError(f"Invalid transform expression: {expression!r}")
+    name, arg_text = match.groups()
+    if name not in functions:
+        raise ValueError(f"Unknown transform function: {name}")
+    args = [parse_argument(a) for a in arg_text.split(',')] if arg_text.strip() else []
+    return name, args
+
+def compile_call(expression):
+    """Compile `fn(arg, ...)` into a function of the output document"""
+    name, args = parse_call(expression)
+    fn = FUNCTIONS[name]
+    getters = [make_getter(path) if path else (lambda doc, value=value: value)
+               for path, value in args]
+    if not getters:
+        return lambda doc: fn()
+    if len(getters) == 1:
+        arg = getters[0]
+        return lambda doc: fn(arg(doc))
+    return lambda doc: fn(*[arg(doc) for arg in getters])
+
+def compile_column_call(expression):
+    """Compile `fn(field, ...)` into a function of a dict of item columns"""
+    name, args = parse_call(expression)
+    fn = FUNCTIONS[name]
+    if not args:
+        return lambda columns, size: [fn() for _ in range(size)]
+    if len(args) == 1 and args[0][0]:
+        field = args[0][0]
+        return lambda columns, size: apply_column(name, columns.get(field) or [None] * size)
+
+    def call(columns, size):
+        values = [columns.get(path) or [None] * size if path else [value] * size
+                  for path, value in args]
+        return list(map(fn, *values))
+    return call
+
+def as_rows(value):
+    """List items of a source list; bureaus send a lone item as an object"""
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        return [value]
+    return [row if isinstance(row, dict) else {} for row in value]
+
+class PathTrie:
+    """Source paths of `map` rules, with shared prefixes stored once"""
+
+    __slots__ = ('children', 'setters')
+
+    def __init__(self):
+        self.children = {}
+        self.setters = []
+
+    def insert(self, parts, setter):
+        node = self
+        for key in parts:
+            node = node.children.setdefault(key, PathTrie())
+        node.setters.append(setter)
+
+    def all_setters(self):
+        setters = list(self.setters)
+        for child in self.children.values():
+            setters.extend(child.all_setters())
+        return setters
+
+    def compile(self):
+        """Return visit(value, out), which walks `value` along the trie once
+        and hands every mapped value to its setter. Missing subtrees map
+        all of their paths to None."""
+        setters = tuple(self.setters)
+        children = tuple((key, child.compile()) for key, child in self.children.items())
+        below = tuple(s for child in self.children.values() for s in child.all_setters())
+        missing = setters + below
+
+        def visit(value, out):
+            if value is None:
+                for setter in missing:
+                    setter(out, None)
+                return
+            for setter in setters:
+                setter(out, value)
+            if isinstance(value, dict):
+                for key, child in children:
+                    child(value.get(key), out)
+            else:
+                for setter in below:
+                    setter(out, None)
+        return visit
+
+class ListMapping:
+    """One `map_lists` rule, applied a column at a time.
+
+    Every field rename pulls one column out of all source items and every
+    transform converts a whole column (see transform_functions.apply_column),
+    so output items are built once at the end rather than rebuilt per rule.
+    Child lists of all items are mapped together in a single batch. Item
+    fields are flat names.
+
+    With `compactPaymentHistory` enabled, a child history list is also
+    packed per year (see payment_history.py) straight from the source
+    rows; `dropSource` skips mapping the child list itself.
+    """
+
+    __slots__ = ('source', 'target', 'name', 'fields', 'transforms', 'children', 'compact')
+
+    def __init__(self, rule):
+        item = rule.get('item') or {}
+        self.source = make_getter(rule['from'])
+        self.target = make_setter(rule['to'])
+        self.name = rule['to']
+        self.fields = tuple(rule_pairs(item.get('map')))
+        self.transforms = tuple((target, compile_column_call(expression))
+                                for target, expression in rule_pairs(item.get('transform')))
+        self.children = tuple(ListMapping(child) for child in item.get('children') or ())
+        self.compact = None
+
+        compact = item.get('compactPaymentHistory') or {}
+        if compact.get('enabled'):
+            source_field = compact.get('sourceField', 'paymentHistory')
+            child = next((c for c in self.children if c.name == source_field), None)
+            fields = {target: field for field, target in child.fields} if child else {}
+            if 'year' not in fields or 'month' not in fields:
+                raise ValueError(f"compactPaymentHistory needs a child list {source_field!r} "
+                                 f"mapping year and month")
+            self.compact = (child.source, PaymentHistoryEncoder(fields),
+                            compact.get('targetField', 'paymentHistoryYearly'))
+            if compact.get('dropSource'):
+                self.children = tuple(c for c in self.children if c is not child)
+
+    def apply(self, source, out):
+        self.target(out, self.map_rows(as_rows(self.source(source))))
+
+    def map_rows(self, rows):
+        size = len(rows)
+        if not size:
+            return []
+        columns = {target: [row.get(field) for row in rows] for field, target in self.fields}
+        for target, call in self.transforms:
+            columns[target] = call(columns, size)
+
+        for child in self.children:
+            child_rows = [as_rows(child.source(row)) for row in rows]
+            mapped = iter(child.map_rows([r for group in child_rows for r in group]))
+            columns[child.name] = [[next(mapped) for _ in group] for group in child_rows]
+
+        if self.compact:
+            history, encoder, target = self.compact
+            columns[target] = [encoder.encode(as_rows(history(row))) for row in rows]
+
+        if not columns:
+            return [{} for _ in rows]
+        names = tuple(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+def make_lookup(path):
+    """Function reading a path from the output, falling back to the source"""
+    get = make_getter(path)
+
+    def lookup(out, source):
+        value = get(out)
+        return get(source) if value is None else value
+    return lookup
+
+def list_field(path, list_names):
+    """Split `accounts.accountType` into a mapped list and an item field"""
+    for name in list_names:
+        if path == name:
+            return name, None
+        if path.startswith(name + '.'):
+            return name, path[len(name) + 1:]
+    return path, None
+
+def shared_values(members):
+    """(name, function) of the SHARED values a group of aggregates uses"""
+    names = dict.fromkeys(name for _, cls, _, _ in members for name in cls.uses)
+    return tuple((name, SHARED[name]) for name in names)
+
+class AggregatePlan:
+    """The `aggregate` rules of a response block.
+
+    Rules whose function is an aggregate (see aggregates.py) are grouped
+    by the list they read, and each group is computed in a single pass
+    over that list, which computes the SHARED values its aggregates use
+    once per item. Other rules are function calls whose path arguments
+    are read from the output, or from the source payload when the output
+    has no such field (e.g. data.report.CAPS).
+    """
+
+    __slots__ = ('passes', 'calls', 'paths')
+
+    def __init__(self, rules, list_names=()):
+        groups = {}
+        self.calls = []
+        # Every path a rule may read, from the output or the source
+        self.paths = set()
+        for rule in rules or ():
+            setter = make_setter(rule['path'])
+            expression = str(rule['fn'])
+            match = CALL_RE.match(expression)
+            if match and match.group(1) in AGGREGATES:
+                name, args = parse_call(expression, AGGREGATES)
+                if not args or not args[0][0]:
+                    raise ValueError(f"Aggregate needs a list argument: {expression!r}")
+                if any(path for path, _ in args[1:]):
+                    raise ValueError(f"Aggregate options must be literals: {expression!r}")
+                collection, field = list_field(args[0][0], list_names)
+                self.paths.add(collection)
+                params = tuple(value for _, value in args[1:])
+                groups.setdefault(collection, []).append((setter, AGGREGATES[name], field, params))
+            else:
+                name, args = parse_call(expression)
+                self.paths.update(path for path, _ in args if path)
+                getters = [make_lookup(path) if path else (lambda out, source, value=value: value)
+                           for path, value in args]
+                self.calls.append((setter, FUNCTIONS[name], getters))
+        self.passes = tuple((make_lookup(collection), tuple(members), shared_values(members))
+                            for collection, members in groups.items())
+
+    def apply(self, out, source):
+        for items, members, uses in self.passes:
+            aggregates = [cls(field, *params) for _, cls, field, params in members]
+            adds = [aggregate.add for aggregate in aggregates]
+            for item in as_rows(items(out, source)):
+                values = {name: fn(item) for name, fn in uses}
+                for add in adds:
+                    add(item, values)
+            for (setter, _, _, _), aggregate in zip(members, aggregates):
+                setter(out, aggregate.result())
+        for setter, fn, getters in self.calls:
+            setter(out, fn(*[get(out, source) for get in getters]))
+
+class CompiledActions:
+    """The rules of one response block.
+
+    `map` copies source paths into the output, `set` writes constants and
+    `transform` rewrites output fields in order, so a transform can use
+    fields produced by earlier ones. `map_lists` then maps source lists
+    (see ListMapping) and `aggregate` summarizes the result (see
+    AggregatePlan). Each map destination should appear once: map rules
+    run in source-path order, not as listed.
+    """
+
+    __slots__ = ('visit', 'constants', 'transforms', 'lists', 'aggregates', 'source_paths')
+
+    def __init__(self, actions):
+        trie = PathTrie()
+        self.source_paths = set()
+        for source, target in rule_pairs(actions.get('map')):
+            trie.insert(split_path(source), make_setter(target))
+            self.source_paths.add(source)
+        self.visit = trie.compile()
+        self.constants = tuple((make_setter(target), value, isinstance(value, (dict, list)))
+                               for target, value in rule_pairs(actions.get('set')))
+        self.transforms = tuple((make_setter(target), compile_call(expression))
+                                for target, expression in rule_pairs(actions.get('transform')))
+        self.lists = tuple(ListMapping(rule) for rule in actions.get('map_lists') or ())
+        self.aggregates = AggregatePlan(actions.get('aggregate'), [m.name for m in self.lists])
+        self.source_paths.update(rule['from'] for rule in actions.get('map_lists') or ())
+        self.source_paths.update(self.aggregates.paths)
+
+    def apply(self, source):
+        out = {}
+        self.visit(source, out)
+        for setter, value, mutable in self.constants:
+            setter(out, copy.deepcopy(value) if mutable else value)
+        for setter, call in self.transforms:
+            setter(out, call(out))
+        for mapping in self.lists:
+            mapping.apply(source, out)
+        self.aggregates.apply(out, source)
+        return out
+
+def status_codes(code):
+    """`200` or `400|401|404` as a tuple of ints"""
+    return tuple(int(part) for part in str(code).split('|') if part.strip())
+
+class ResponseMapping:
+    """A step's `response:` rules, compiled once and keyed by status code"""
+
+    def __init__(self, response_rules):
+        self.by_status = {}
+        for block in response_rules or ():
+            actions = CompiledActions(block.get('actions') or {})
+            for status in status_codes(block.get('code', 200)):
+                self.by_status.setdefault(status, actions)
+
+    def source_paths(self):
+        """Every source payload path the rules read"""
+        paths = set()
+        for actions in self.by_status.values():
+            paths |= actions.source_paths
+        return paths
+
+    def apply(self, source, status=200):
+        """Normalize `source`; None when no block handles the status"""
+        actions = self.by_status.get(status)
+        return None if actions is None else actions.apply(source)
@@ -0,0 +1,104 @@
+from array import array
+
+# Month slot with no history row
+NO_DATA = -1
+NO_CLASSIFICATION = '-'
+# Largest days-past-due value an 'h' slot holds
+MAX_DAYS_PAST_DUE = 32767
+
+EMPTY_YEAR = array('h', [NO_DATA] * 12)
+
+def to_slot_int(value, default=0):
+    """History values arrive as ints or strings; blanks count as 0 like to_int()"""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip() or default)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return default
+
+class PaymentHistoryEncoder:
+    """Packs monthly history rows into one entry per year:
+
+        {"2024": {"daysPastDue": array('h', [0, 0, 30, -1, ...]),
+                  "assetClassification": "SS?S-......."}}
+
+        Month m is slot m - 1; months without a row hold -1 and '-'.
+        Rows without a valid year or month are skipped. Asset
+        classifications are packed into a string when every code of the
+        year is one character; a year with longer codes (such as 'SMA' or
+        'DBT') keeps them as a list of 12 codes instead.
+
+    `fields` maps year/month/daysPastDue/assetClassification to the raw
+    field names, so rows are packed straight from the bureau payload.
+    """
+
+    def __init__(self, fields):
+        self.year = fields['year']
+        self.month = fields['month']
+        self.days_past_due = fields.get('daysPastDue')
+        self.classification = fields.get('assetClassification')
+
+    def encode(self, rows):
+        years = {}
+        for row in rows:
+            get = row.get
+            # int() takes the common well-formed values directly
+            try:
+                month = int(get(self.month))
+            except (TypeError, ValueError):
+                month = to_slot_int(get(self.month))
+            if not 1 <= month <= 12:
+                continue
+            try:
+                year = int(get(self.year))
+            except (TypeError, ValueError):
+                year = to_slot_int(get(self.year), None)
+            if not year:
+                continue
+
+            slots = years.get(year)
+            if slots is None:
+                slots = years[year] = (array('h', EMPTY_YEAR), [NO_CLASSIFICATION] * 12)
+            days, classes = slots
+            if self.days_past_due:
+                value = get(self.days_past_due)
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    value = to_slot_int(value)
+                days[month - 1] = min(max(value, 0), MAX_DAYS_PAST_DUE)
+            else:
+                days[month - 1] = 0
+            if self.classification:
+                code = get(self.classification)
+                if code is not None and code != '':
+                    classes[month - 1] = str(code)
+        return {str(year): {"daysPastDue": days, "assetClassification": pack_codes(classes)}
+                for year, (days, classes) in sorted(years.items())}
+
+def pack_codes(codes):
+    """One string for single-character codes, the list itself otherwise"""
+    if all(len(code) == 1 for code in codes):
+        return ''.join(codes)
+    return codes
+
+def days_past_due_summary(packed):
+    """(months with history, months 0 days past due, most days past due)
+    of a packed history, counted a year at a time"""
+    months = on_time = most = 0
+    for entry in (packed or {}).values():
+        days = entry["daysPastDue"]
+        months += 12 - days.count(NO_DATA)
+        on_time += days.count(0)
+        most = max(most, max(days))
+    return months, on_time, most
+
+def json_default(value):
+    """json.dumps(default=...) hook for packed histories"""
+    if isinstance(value, array):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
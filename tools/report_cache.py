@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Context key the previous-report query writes, and the step handlers that
+# read and save reports in the reports table
+PREVIOUS_REPORT_KEY = 'previousReportData'
+REPORT_QUERY_STEP = 'declarative_query_item'
+REPORT_SAVE_STEP = 'declarative_save_data'
+
+DEFAULT_TTL = 15 * 60
+DEFAULT_MAX_ENTRIES = 10000
+
+def has_report(report):
+    """False for a missing report and for a record none of whose fields
+    resolved (such as a save whose rres was never produced)"""
+    if isinstance(report, dict):
+        return any(value is not None for value in report.values())
+    return report is not None
+
+class ReportCache:
+    """Previous reports keyed by customer icid, with a TTL and LRU eviction.
+
+    Entries live in memory; when `cache_dir` is set they are also written
+    there as JSON so other processes (and restarts) can reuse them. Disk
+    entries carry a wall-clock timestamp and expire with the same TTL.
+    The async variants run disk access on a worker thread so a server's
+    event loop never blocks on it.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, cache_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, icid):
+        """Return the cached report for icid, or None when absent or expired"""
+        if icid is None:
+            return None
+        now = time.time()
+        report = self.get_memory(icid, now)
+        if report is not None:
+            return report
+        return self.load(icid, self.read_disk(icid, now))
+
+    async def get_async(self, icid):
+        """get() with the disk tier read on a worker thread"""
+        if icid is None:
+            return None
+        now = time.time()
+        report = self.get_memory(icid, now)
+        if report is not None:
+            return report
+        entry = await asyncio.to_thread(self.read_disk, icid, now) if self.cache_dir else None
+        return self.load(icid, entry)
+
+    def put(self, icid, report):
+        entry = self.put_memory(icid, report)
+        if entry is not None:
+            self.write_disk(icid, entry)
+
+    async def put_async(self, icid, report):
+        """put() with the disk tier written on a worker thread"""
+        entry = self.put_memory(icid, report)
+        if entry is not None and self.cache_dir:
+            await asyncio.to_thread(self.write_disk, icid, entry)
+
+    def get_memory(self, icid, now):
+        """The in-memory report for icid (a hit), or None"""
+        with self.lock:
+            entry = self.entries.get(icid)
+            if entry is None:
+                return None
+            stored_at, report = entry
+            if now - stored_at < self.ttl:
+                self.entries.move_to_end(icid)
+                self.hits += 1
+                return report
+            del self.entries[icid]
+            return None
+
+    def load(self, icid, entry):
+        """Count a lookup that missed memory and keep what the disk had"""
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.store(icid, entry)
+            return entry[1]
+
+    def put_memory(self, icid, report):
+        """Store a report in memory; returns the entry for the disk tier"""
+        if icid is None or not has_report(report):
+            return None
+        entry = (time.time(), report)
+        with self.lock:
+            self.store(icid, entry)
+        return entry
+
+    def invalidate(self, icid):
+        with self.lock:
+            self.entries.pop(icid, None)
+        path = self.disk_path(icid)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def store(self, icid, entry):
+        """Insert an entry and evict least recently used ones (lock held)"""
+        self.entries[icid] = entry
+        self.entries.move_to_end(icid)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def disk_path(self, icid):
+        if not self.cache_dir:
+            return None
+        name = hashlib.sha256(str(icid).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.json')
+
+    def read_disk(self, icid, now):
+        path = self.disk_path(icid)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('icid') != icid or now - data.get('storedAt', 0) >= self.ttl:
+            return None
+        if not has_report(data.get('report')):
+            return None
+        return (data['storedAt'], data['report'])
+
+    def write_disk(self, icid, entry):
+        path = self.disk_path(icid)
+        if not path:
+            return
+        stored_at, report = entry
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'icid': icid, 'storedAt': stored_at, 'report': report}, f)
+        os.replace(tmp_path, path)
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+def saved_record(step_content, context, projection=None):
+    """The record a declarative_save_data step writes, as the report query
+    reads it back.
+
+    Fields copied from a context value (`source.refValueKey`/`dataKey`)
+    are filled in; keys composed from `parts` are left out. `projection`
+    limits the record to the fields the query reads. None when none of
+    those fields resolved, as there is then no report to serve.
+    """
+    params = step_content.get('params') or {}
+    default_key = (params.get('defaults') or {}).get('refValueKey')
+    saved = (params.get('dbParams') or {}).get('keysToSave')
+    record = {}
+    for field in params.get('fields') or ():
+        name = field.get('name')
+        source = field.get('source')
+        if not source or (saved and name not in saved) or (projection and name not in projection):
+            continue
+        value = context.get_key(source.get('refValueKey') or default_key)
+        data_key = source.get('dataKey')
+        if data_key:
+            value = value.get(data_key) if isinstance(value, dict) else None
+        record[name] = value
+    return record if has_report(record) else None
@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import lazy_json
+from mapping_engine import ResponseMapping
+
+# Simulated latency per step type (seconds)
+STEP_DELAYS = {
+    'business': 0.5,
+    'db': 1.0,
+    'vendor': 1.5,
+}
+GENERIC_STEP_DELAY = 0.3
+
+# Progress messages per step type: (start, done)
+STEP_MESSAGES = {
+    'business': ("🔧 Executing business logic...", "✅ Business logic completed"),
+    'db': ("🗄️  Executing database operation...", "✅ Database operation completed"),
+    'vendor': ("🌐 Executing vendor API call...", "✅ Vendor API call completed"),
+}
+GENERIC_STEP_MESSAGES = ("⚙️  Executing generic step...", "✅ Generic step completed")
+
+# Vendor status code the simulated vendor call answers with
+SIMULATED_VENDOR_STATUS = 200
+
+# Step handler name (the step's `name:`) -> executor class
+EXECUTORS = {}
+
+class StepExecutor:
+    """Runs one step of a plan.
+
+    An executor is built once per step when a route is loaded, so anything
+    derived from the step file belongs in setup(); run() and run_async()
+    get the step bound for the current execution and its ExecutionContext.
+    `reads` and `writes` are the context handles of the step's keys. One
+    executor serves every concurrent execution of its step and must not
+    keep per-run state.
+
+    The base class simulates the step: it waits for the latency of the
+    step's `type` and fills its output keys with a marker value.
+    """
+
+    def __init__(self, step_content, reads=(), writes=()):
+        self.step_id = step_content.get('id')
+        self.reads = reads
+        self.writes = writes
+        self.step_type = step_content.get('type', 'generic')
+        self.delay = STEP_DELAYS.get(self.step_type, GENERIC_STEP_DELAY)
+        self.messages = STEP_MESSAGES.get(self.step_type, GENERIC_STEP_MESSAGES)
+        self.setup(step_content)
+
+    def setup(self, step_content):
+        """One-time preparation from the (unbound) step file"""
+
+    def source_paths(self):
+        """Paths this step reads from its input documents, or None when it
+        may read anything"""
+        return None
+
+    def select_outputs(self, paths):
+        """Called at load time with the paths that the readers of this
+        step's outputs use (None when some reader may use everything)"""
+
+    def run(self, step_content, context, log):
+        started, done = self.messages
+        log(f"   {started}")
+        time.sleep(self.delay)
+        self.write_outputs(context)
+        log(f"   {done}")
+
+    async def run_async(self, step_content, context, log):
+        started, done = self.messages
+        log(f"   {started}")
+        await asyncio.sleep(self.delay)
+        self.write_outputs(context)
+        log(f"   {done}")
+
+    def write_outputs(self, context):
+        for handle in self.writes:
+            context.set(handle, {"producedBy": self.step_id})
+
+def register(*names):
+    """Class decorator registering an executor for step handler names"""
+    def decorator(cls):
+        for name in names:
+            EXECUTORS[name] = cls
+        return cls
+    return decorator
+
+def create_executor(step_content, reads=(), writes=()):
+    """Executor for a parsed step; unknown handler names are simulated"""
+    return EXECUTORS.get(step_content.get('name'), StepExecutor)(step_content, reads, writes)
+
+@register('vendor_response_handler_v2')
+class VendorResponseHandler(StepExecutor):
+    """Normalizes the vendor payload with the step's `response:` rules.
+
+    The rules are compiled once in setup() (see mapping_engine); each run
+    maps the payload the step reads into the keys it writes.
+    """
+
+    def setup(self, step_content):
+        self.mapping = ResponseMapping((step_content.get('params') or {}).get('response'))
+
+    def source_paths(self):
+        return self.mapping.source_paths()
+
+    def write_outputs(self, context):
+        source = context.get(self.reads[0]) if self.reads else None
+        result = self.mapping.apply(source, SIMULATED_VENDOR_STATUS)
+        for handle in self.writes:
+            context.set(handle, result)
+
+@register('transform_json_string_to_map_data')
+class JsonStringDecoder(StepExecutor):
+    """Decodes a JSON string (the `source.dataKey` field of the input, such
+    as a stored report's rres) into a map.
+
+    When every reader of the result declares the paths it uses and orjson
+    is not installed, only those subtrees are kept (see lazy_json).
+    `source.partialDecode: false` always decodes the whole document.
+    """
+
+    def setup(self, step_content):
+        source = (step_content.get('params') or {}).get('source') or {}
+        self.data_key = source.get('dataKey')
+        self.partial = source.get('partialDecode', True)
+        self.selection = None
+
+    def select_outputs(self, paths):
+        if self.partial and paths is not None:
+            self.selection = lazy_json.Selection.from_paths(paths)
+
+    def write_outputs(self, context):
+        value = context.get(self.reads[0]) if self.reads else None
+        if self.data_key and isinstance(value, dict):
+            value = value.get(self.data_key)
+        if isinstance(value, (str, bytes)):
+            value = lazy_json.decode(value, self.selection)
+        for handle in self.writes:
+            context.set(handle, value)
+
+def select_outputs(executors, layout, barriers):
+    """Tell every executor which paths the readers of its outputs use.
+
+    Readers are the later steps; those with unresolved or unnamed context
+    keys (`barriers`) may read anything.
+    """
+    for index, executor in enumerate(executors):
+        if executor is None or not layout.writes[index]:
+            continue
+        written = set(layout.writes[index])
+        paths = set()
+        for reader in range(index + 1, len(executors)):
+            reads = layout.reads[reader]
+            if executors[reader] is None:
+                continue
+            if barriers[reader]:
+                paths = None
+                break
+            if written.intersection(reads):
+                needed = executors[reader].source_paths()
+                if needed is None:
+                    paths = None
+                    break
+                paths |= needed
+        executor.select_outputs(paths)
+
+# Handlers used by the bundled step files. They are simulated until a real
+# implementation is registered under the same name.
+register(
+    'declarative_read_item',
+    'declarative_query_item',
+    'declarative_save_data',
+    'declarative_encrypted_jwt_token',
+    'declarative_response_mapper',
+    'declarative_vendor_rest_execute',
+    'decrypt_encrypted_data',
+    'derived_data',
+    'transfer_item',
+    'txn_id_gen',
+    'validate',
+)(StepExecutor)
@@ -0,0 +1,124 @@
+import os
+import re
+
+# ${name} and ${args.name} placeholders
+PLACEHOLDER_RE = re.compile(r'\$\{([^}]+)\}')
+
+class Placeholder:
+    """One ${...} reference. `namespace` is 'args' for ${args.name}, else None"""
+
+    __slots__ = ('namespace', 'name', 'text')
+
+    def __init__(self, expr):
+        self.text = '${' + expr + '}'
+        expr = expr.strip()
+        if expr.startswith('args.'):
+            self.namespace, self.name = 'args', expr[5:]
+        else:
+            self.namespace, self.name = None, expr
+
+    def resolve(self, params, env):
+        """Value for this placeholder, or its own text when unbound"""
+        if self.name in params:
+            return params[self.name]
+        if self.namespace is None and env is not None and self.name in env:
+            return env[self.name]
+        return self.text
+
+    def __getstate__(self):
+        return (self.namespace, self.name, self.text)
+
+    def __setstate__(self, state):
+        self.namespace, self.name, self.text = state
+
+def parse_template(text):
+    """Split a string into literal and Placeholder parts (None if no placeholders)"""
+    parts = []
+    pos = 0
+    for m in PLACEHOLDER_RE.finditer(text):
+        if m.start() > pos:
+            parts.append(text[pos:m.start()])
+        parts.append(Placeholder(m.group(1)))
+        pos = m.end()
+    if not parts:
+        return None
+    if pos < len(text):
+        parts.append(text[pos:])
+    return tuple(parts)
+
+def render(parts, params, env):
+    # A value that is exactly one placeholder keeps the bound value's type
+    # (e.g. projectionFields: "${args.projectionFields}" binds to a list)
+    if len(parts) == 1:
+        return parts[0].resolve(params, env)
+    return ''.join(part if isinstance(part, str) else str(part.resolve(params, env))
+                   for part in parts)
+
+def copy_container(node):
+    return dict(node) if isinstance(node, dict) else list(node)
+
+class StepTemplate:
+    """A parsed step with the location of every placeholder compiled once.
+
+    bind() copies only the containers on the way to a placeholder and shares
+    every other subtree with the template, so instantiating a step costs
+    O(placeholders) rather than a walk of the whole step. Bound steps must
+    be treated as read-only.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.slots = []
+        self.names = set()
+        containers = set()
+
+        def walk(node, path):
+            items = node.items() if isinstance(node, dict) else enumerate(node)
+            for key, value in items:
+                if isinstance(value, str):
+                    parts = parse_template(value)
+                    if parts:
+                        self.slots.append((path, key, parts))
+                        self.names.update(p.name for p in parts if isinstance(p, Placeholder))
+                        containers.update(path[:depth] for depth in range(len(path) + 1))
+                elif isinstance(value, (dict, list)):
+                    walk(value, path + (key,))
+
+        if isinstance(content, (dict, list)):
+            walk(content, ())
+        # Parents are copied before their children
+        self.containers = sorted(containers, key=len)
+
+    def bind(self, params=None, env=None):
+        """Return the step with placeholders substituted.
+
+        ${args.name} is looked up in params; ${name} in params, then env
+        (os.environ by default). Unbound placeholders are left as written.
+        """
+        if not self.slots:
+            return self.content
+        params = params or {}
+        if env is None:
+            env = os.environ
+
+        nodes = {}
+        for path in self.containers:
+            if not path:
+                nodes[path] = copy_container(self.content)
+            else:
+                parent = nodes[path[:-1]]
+                nodes[path] = parent[path[-1]] = copy_container(parent[path[-1]])
+        for path, key, parts in self.slots:
+            nodes[path][key] = render(parts, params, env)
+        return nodes[()]
+
+def bind_params(params, env=None):
+    """Resolve ${ENV} placeholders inside param values (e.g. a table name
+    passed as ${BS_REPORTS_TABLE_NAME})"""
+    if env is None:
+        env = os.environ
+    bound = {}
+    for name, value in params.items():
+        parts = parse_template(value) if isinstance(value, str) else None
+        bound[name] = render(parts, {}, env) if parts else value
+    return bound
@@ -0,0 +1,50 @@
+import re
+
+# Unicode space separators (category Zs) other than U+0020, mapped to a
+# plain space. Common ones sneak in from editors/copy-paste.
+SPACE_SEPARATORS = (
+    '\u00A0'    # no-break space
+    '\u1680'    # ogham space mark
+    '\u2000\u2001\u2002\u2003\u2004\u2005\u2006'    # en/em quads and spaces
+    '\u2007'    # figure space
+    '\u2008\u2009\u200A'    # punctuation, thin and hair space
+    '\u202F'    # narrow no-break space
+    '\u205F'    # medium mathematical space
+    '\u3000'    # ideographic space
+)
+
+# Invisible characters that are dropped entirely
+ZERO_WIDTH = (
+    '\u180E'    # mongolian vowel separator
+    '\u200B'    # zero width space
+    '\u200C'    # zero width non-joiner
+    '\u200D'    # zero width joiner
+    '\u2060'    # word joiner
+    '\uFEFF'    # byte order mark / zero width no-break space
+)
+
+SPACE_TABLE = str.maketrans(
+    {ch: ' ' for ch in SPACE_SEPARATORS} | {ch: None for ch in ZERO_WIDTH})
+
+# Whitespace (as str.rstrip sees it) at the end of each line
+TRAILING_WS_RE = re.compile(r'[^\S\n]+$', re.MULTILINE)
+
+def normalize_spaces(text: str) -> str:
+    """Map unicode spaces to ' ' and drop zero-width characters and BOMs.
+
+    Pure ASCII text is returned as is without being copied.
+    """
+    if text.isascii():
+        return text
+    return text.translate(SPACE_TABLE)
+
+def normalize_line(line: str) -> str:
+    """normalize() for a single line without its newline"""
+    return normalize_spaces(line).rstrip()
+
+def normalize(text: str) -> str:
+    """Normalize spaces, convert CRLF/CR to LF and strip trailing whitespace"""
+    text = normalize_spaces(text)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return TRAILING_WS_RE.sub('', text)
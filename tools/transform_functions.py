@@ -0,0 +1,279 @@
+import datetime
+import functools
+import math
+
+# NumPy speeds up numeric columns when installed; everything works without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Function name as written in step files -> implementation
+FUNCTIONS = {}
+# Function name -> version taking a whole column of values and returning a list
+COLUMN_FUNCTIONS = {}
+
+# Columns shorter than this are not worth building an array for
+NUMPY_MIN_ROWS = 64
+# Largest magnitude a float64 holds exactly as an integer
+EXACT_FLOAT_INT = 2 ** 53
+# Distinct raw dates remembered by normalize_date_yyyymmdd
+DATE_CACHE_SIZE = 4096
+
+def transform_function(fn):
+    """Register a function for use in `transform:` and `aggregate:` rules"""
+    FUNCTIONS[fn.__name__] = fn
+    return fn
+
+def column_function(name):
+    """Register the column version of a transform function"""
+    def decorator(fn):
+        COLUMN_FUNCTIONS[name] = fn
+        return fn
+    return decorator
+
+def apply_column(name, values):
+    """Apply a transform function to every value of a column"""
+    column_fn = COLUMN_FUNCTIONS.get(name)
+    if column_fn is not None:
+        return column_fn(values)
+    return list(map(FUNCTIONS[name], values))
+
+def blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+@transform_function
+def null_to_null():
+    return None
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE, typed=True)
+def parse_date_yyyymmdd(value):
+    if blank(value):
+        return None
+    text = str(value).strip()
+    if len(text) != 8 or not text.isdigit():
+        return None
+    try:
+        datetime.date(int(text[:4]), int(text[4:6]), int(text[6:]))
+    except ValueError:
+        return None
+    return f'{text[:4]}-{text[4:6]}-{text[6:]}'
+
+@transform_function
+def normalize_date_yyyymmdd(value):
+    """Bureau dates (20190315 or '20190315') as '2019-03-15'; None if invalid.
+
+    Reports repeat the same dates across accounts, so results are kept in
+    a bounded LRU cache (see date_cache_info()).
+    """
+    try:
+        return parse_date_yyyymmdd(value)
+    except TypeError:
+        return None  # unhashable, so not a date
+
+@column_function('normalize_date_yyyymmdd')
+def normalize_date_column(values):
+    """normalize_date_yyyymmdd() for a whole column of raw dates"""
+    try:
+        return list(map(parse_date_yyyymmdd, values))
+    except TypeError:
+        return list(map(normalize_date_yyyymmdd, values))
+
+def date_cache_info():
+    return parse_date_yyyymmdd.cache_info()
+
+@transform_function
+def to_int(value):
+    """Integer value, 0 when blank or not a number"""
+    number = to_int_or_null(value)
+    return 0 if number is None else number
+
+@transform_function
+def to_int_or_null(value):
+    if blank(value):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+@transform_function
+def to_number_or_null(value):
+    """Amounts as numbers: int when whole ('150000', 1.0), float otherwise;
+    None if blank or invalid"""
+    if blank(value) or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = value.strip().replace(',', '')
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number):
+        return None
+    return int(number) if number.is_integer() else number
+
+def numeric_array(values):
+    """float64 array for a column, or None when NumPy can't convert it
+    exactly the way the scalar functions would"""
+    if numpy is None or len(values) < NUMPY_MIN_ROWS:
+        return None
+    if any(value is True or value is False for value in values):
+        return None
+    try:
+        array = numpy.array(values, dtype=numpy.float64)
+    except (TypeError, ValueError):
+        return None  # e.g. blank strings or '1,000'
+    if array.ndim != 1:
+        return None
+    finite = numpy.isfinite(array)
+    if (numpy.abs(array[finite]) >= EXACT_FLOAT_INT).any():
+        return None
+    return array
+
+@column_function('to_number_or_null')
+def to_number_or_null_column(values):
+    array = numeric_array(values)
+    if array is None:
+        return list(map(to_number_or_null, values))
+    finite = numpy.isfinite(array)
+    whole = finite & (array == numpy.trunc(array))
+    return [int(number) if is_whole else (number if is_finite else None)
+            for number, is_whole, is_finite
+            in zip(array.tolist(), whole.tolist(), finite.tolist())]
+
+@column_function('to_int_or_null')
+def to_int_or_null_column(values):
+    array = numeric_array(values)
+    if array is None:
+        return list(map(to_int_or_null, values))
+    finite = numpy.isfinite(array)
+    truncated = numpy.trunc(numpy.where(finite, array, 0)).astype(numpy.int64)
+    return [number if is_finite else None
+            for number, is_finite in zip(truncated.tolist(), finite.tolist())]
+
+# Lower bound of each score band, highest first
+SCORE_GRADES = (
+    (750, 'Excellent'),
+    (700, 'Good'),
+    (650, 'Fair'),
+    (550, 'Poor'),
+)
+
+@transform_function
+def score_to_grade(score):
+    score = to_int_or_null(score)
+    if score is None:
+        return None
+    for floor, grade in SCORE_GRADES:
+        if score >= floor:
+            return grade
+    return 'Very Poor'
+
+PORTFOLIO_TYPES = {
+    'I': 'INSTALLMENT',
+    'M': 'MORTGAGE',
+    'O': 'OPEN',
+    'R': 'REVOLVING',
+    'C': 'LINE_OF_CREDIT',
+}
+
+# CAIS Account_Type codes
+ACCOUNT_TYPES = {
+    '1': 'Auto Loan',
+    '2': 'Housing Loan',
+    '3': 'Property Loan',
+    '4': 'Loan Against Shares/Securities',
+    '5': 'Personal Loan',
+    '6': 'Consumer Loan',
+    '7': 'Gold Loan',
+    '8': 'Education Loan',
+    '9': 'Loan to Professional',
+    '10': 'Credit Card',
+    '11': 'Leasing',
+    '12': 'Overdraft',
+    '13': 'Two-Wheeler Loan',
+    '14': 'Non-Funded Credit Facility',
+    '15': 'Loan Against Bank Deposits',
+    '16': 'Fleet Card',
+    '17': 'Commercial Vehicle Loan',
+    '31': 'Secured Credit Card',
+    '32': 'Used Car Loan',
+    '33': 'Construction Equipment Loan',
+    '34': 'Tractor Loan',
+    '35': 'Corporate Credit Card',
+    '51': 'Business Loan',
+    '61': 'Business Loan - Priority Sector',
+}
+
+# CAIS Account_Status codes
+ACCOUNT_STATUSES = {
+    '11': 'ACTIVE',
+    '21': 'DELINQUENT', '22': 'DELINQUENT', '23': 'DELINQUENT',
+    '24': 'DELINQUENT', '25': 'DELINQUENT',
+    '13': 'CLOSED', '14': 'CLOSED', '15': 'CLOSED', '16': 'CLOSED', '17': 'CLOSED',
+    '53': 'SUIT_FILED',
+    '71': 'SETTLED',
+    '78': 'WRITTEN_OFF', '79': 'WRITTEN_OFF', '82': 'WRITTEN_OFF',
+}
+
+def code_key(value):
+    """Bureau codes arrive as ints or zero-padded strings ('05')"""
+    if blank(value):
+        return None
+    text = str(value).strip()
+    return (text.lstrip('0') or '0') if text.isdigit() else text.upper()
+
+@transform_function
+def map_portfolio(value):
+    return PORTFOLIO_TYPES.get(code_key(value), value)
+
+@transform_function
+def map_account_type(value):
+    return ACCOUNT_TYPES.get(code_key(value), value)
+
+@transform_function
+def map_status_code(value):
+    return ACCOUNT_STATUSES.get(code_key(value), value)
+
+@transform_function
+def get_secured_unsecured_percent(secured, unsecured):
+    secured = to_number_or_null(secured) or 0
+    unsecured = to_number_or_null(unsecured) or 0
+    total = secured + unsecured
+    if not total:
+        return None
+    return {"secured": round(secured * 100 / total, 2),
+            "unsecured": round(unsecured * 100 / total, 2)}
+
+@transform_function
+def hard_enquiries_from_caps(caps):
+    """Credit enquiry counts from a CAPS block's CAPS_Summary"""
+    summary = (caps or {}).get('CAPS_Summary') or {}
+    return {
+        "last7Days": to_int_or_null(summary.get('CapsLast7Days')),
+        "last30Days": to_int_or_null(summary.get('CapsLast30Days')),
+        "last90Days": to_int_or_null(summary.get('CapsLast90Days')),
+        "last180Days": to_int_or_null(summary.get('CapsLast180Days')),
+    }
+
+@transform_function
+def dti_placeholder():
+    """Debt-to-income needs the applicant's income, which bureaus don't report"""
+    return None
+
+@transform_function
+def single_score_point(date, score):
+    if score is None:
+        return []
+    return [{"date": date, "score": to_int_or_null(score)}]
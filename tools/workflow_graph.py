@@ -0,0 +1,171 @@
+# `mappers` entries of a vendor call naming the context keys it reads and
+# writes (reponseData is spelled as in the step files)
+MAPPER_READS = ('endPointKey', 'payloadKey')
+MAPPER_WRITES = ('reponseData', 'responseData')
+
+def is_bound(value):
+    """A key with no placeholder left (step content is bound before its
+    keys are collected; see step_templates)"""
+    return isinstance(value, str) and '${' not in value
+
+class StepKeys:
+    """Context keys a step reads and writes.
+
+    `barrier` is set when a key could not be resolved; such a step is
+    ordered against every other step. `reads_all` is set for steps that
+    also read keys their params do not name; such a step reads every key
+    written before it.
+    """
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self.barrier = False
+        self.reads_all = False
+
+    def add(self, target, value):
+        if is_bound(value):
+            target.add(value)
+        else:
+            self.barrier = True
+
+    def __repr__(self):
+        return (f"StepKeys(reads={sorted(self.reads)}, writes={sorted(self.writes)}, "
+                f"barrier={self.barrier}, reads_all={self.reads_all})")
+
+def step_context_keys(step_content):
+    """Collect the context keys a step reads and writes.
+
+    Writes are `resultContextKey`, `destination.refValueKey` and the
+    `outputField`s of `derivedFields`. Reads are `refValueKey`s under
+    `source` blocks and `defaults.refValueKey` - unless the latter names
+    the step's own output, as it does for db reads.
+
+    A step with `mappers` is a vendor call: it reads and writes the keys
+    its mappers name, and also sends request headers built by earlier
+    steps that no param names, so it reads everything before it.
+    `step_content` is bound; keys still holding a placeholder make the
+    step a barrier.
+    """
+    keys = StepKeys()
+    defaults = []
+
+    def walk(node, parent_key=None):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == 'resultContextKey':
+                    keys.add(keys.writes, value)
+                elif key == 'outputField' and parent_key == 'derivedFields':
+                    keys.add(keys.writes, value)
+                elif key in MAPPER_READS and parent_key == 'mappers':
+                    keys.add(keys.reads, value)
+                elif key in MAPPER_WRITES and parent_key == 'mappers':
+                    keys.add(keys.writes, value)
+                elif key == 'refValueKey':
+                    if parent_key == 'destination':
+                        keys.add(keys.writes, value)
+                    elif parent_key == 'defaults':
+                        defaults.append(value)
+                    else:
+                        keys.add(keys.reads, value)
+                else:
+                    walk(value, key)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, parent_key)
+
+    params = (step_content or {}).get('params', {})
+    walk(params)
+    keys.reads_all = isinstance(params, dict) and bool(params.get('mappers'))
+
+    for value in defaults:
+        if value not in keys.writes:
+            keys.add(keys.reads, value)
+    return keys
+
+class StepNode:
+    """Scheduling constraints for one step.
+
+    `after` holds steps that must finish first (read-after-write and
+    write-after-write). `started` holds earlier readers of a key this step
+    writes; those only need to have started, since a step reads its inputs
+    when it starts and publishes its outputs when it finishes.
+    """
+
+    def __init__(self, index, keys):
+        self.index = index
+        self.keys = keys
+        self.after = set()
+        self.started = set()
+
+def build_step_graph(step_keys):
+    """Derive a dependency graph from the list-ordered step keys"""
+    nodes = []
+    last_writer = {}
+    readers = {}
+    last_barrier = None
+
+    for index, keys in enumerate(step_keys):
+        node = StepNode(index, keys)
+
+        if keys.barrier:
+            node.after.update(range(index))
+        else:
+            if last_barrier is not None:
+                node.after.add(last_barrier)
+            if keys.reads_all:
+                node.after.update(last_writer.values())
+                for key in last_writer:
+                    readers.setdefault(key, set()).add(index)
+            for key in keys.reads:
+                if key in last_writer:
+                    node.after.add(last_writer[key])
+            for key in keys.writes:
+                if key in last_writer:
+                    node.after.add(last_writer[key])
+                node.started.update(r for r in readers.get(key, ()) if r != index)
+
+        node.started -= node.after
+        nodes.append(node)
+
+        if keys.barrier:
+            # Everything after a barrier is ordered behind it already
+            last_barrier = index
+            last_writer = {}
+            readers = {}
+        for key in keys.reads:
+            readers.setdefault(key, set()).add(index)
+        for key in keys.writes:
+            last_writer[key] = index
+            readers[key] = set()
+
+    return nodes
+
+def add_branch_edges(nodes, branch_targets):
+    """Order steps a branch may skip behind the branching step.
+
+    `branch_targets[i]` maps outcome -> target index for step i. Every step
+    strictly between a branching step and its furthest forward target has
+    to wait for the branch decision before it can run or be skipped.
+    """
+    for index, targets in enumerate(branch_targets):
+        forward = [target for target in targets.values() if target > index]
+        for skipped in range(index + 1, max(forward, default=index)):
+            nodes[skipped].after.add(index)
+            nodes[skipped].started.discard(index)
+    return nodes
+
+def execution_waves(nodes):
+    """Group step indexes into waves that may run side by side"""
+    level = {}
+    for node in nodes:
+        deps = [level[i] + 1 for i in node.after]
+        deps += [level[i] for i in node.started]
+        level[node.index] = max(deps, default=0)
+
+    waves = []
+    for index, wave in level.items():
+        while len(waves) <= wave:
+            waves.append([])
+        waves[wave].append(index)
+    return waves
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml_loader
+from execution_context import ContextLayout
+from step_templates import StepTemplate, parse_template
+from workflow_graph import add_branch_edges, build_step_graph, step_context_keys
+
+# Bump when the plan layout changes so stale on-disk plans are ignored
+PLAN_FORMAT = 7
+PLAN_CACHE_DIR = '.plan_cache'
+# Threads used to read and parse step files while compiling a plan
+PRELOAD_WORKERS = 8
+
+# One compiled step. `content` is the parsed step file (None when missing);
+# `params` and `args` are the include's ?query parameters and args: block
+# and `bound_args` the two merged (args win). `branches` maps a step
+# outcome to the index of the step to jump to, `template` holds the step's
+# compiled ${...} placeholders and `env_names` the environment variables
+# binding may read. Inline steps written in the route have no include_path.
+PlanStep = namedtuple('PlanStep', 'number include_path original_path params args bound_args '
+                                  'content branches template env_names')
+
+# A compiled route. `layout` assigns context slots to the keys steps pass
+# around; `sources` holds (path, mtime_ns, size) for every file that
+# contributed to the plan and `fingerprint` hashes their contents.
+WorkflowPlan = namedtuple('WorkflowPlan',
+                          'workflow_file workflow steps graph layout sources fingerprint')
+
+def parse_route(data, path=None):
+    """Parse route YAML into (workflow info, step entries).
+
+    Step entries are yaml_loader.Include nodes for `!include` lines and
+    plain dicts for steps written inline.
+    """
+    route = yaml_loader.load(data, path) or {}
+    if not isinstance(route, dict):
+        raise ValueError(f"Route {path or ''} is not a mapping")
+
+    workflow = {key: value for key, value in route.items() if key != 'steps'}
+    entries = []
+    for entry in route.get('steps') or []:
+        if not isinstance(entry, (yaml_loader.Include, dict)):
+            raise ValueError(f"Unsupported step entry in {path or 'route'}: {entry!r}")
+        entries.append(entry)
+    return workflow, entries
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def stat_source(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (path, None, None)
+    return (path, st.st_mtime_ns, st.st_size)
+
+def read_source(path):
+    """Return (stat source, bytes) for a file; bytes is None when missing"""
+    source = stat_source(path)
+    if source[1] is None:
+        return source, None
+    try:
+        return source, read_bytes(path)
+    except FileNotFoundError:
+        return stat_source(path), None
+
+def parse_step(path, data):
+    return (yaml_loader.load(data, path) if data else None) or None
+
+def sources_unchanged(sources):
+    return all(stat_source(source[0]) == source for source in sources)
+
+def fingerprint(route_bytes, include_bytes):
+    """Hash the route and every include (missing files hash as absent)"""
+    digest = hashlib.sha256(f'plan-v{PLAN_FORMAT}\0'.encode())
+    digest.update(route_bytes)
+    for path, data in include_bytes:
+        digest.update(b'\0' + path.encode('utf-8') + b'\0')
+        digest.update(b'\1' if data is None else b'\2' + data)
+    return digest.hexdigest()
+
+def compile_step(number, include_path, target, query, args, content):
+    """Merge include params once and compile the step's template"""
+    bound_args = {**query, **(args if isinstance(args, dict) else {})}
+    template = StepTemplate(content)
+
+    # ${name} falls back to the environment when no arg supplies it, and
+    # arg values may reference environment variables themselves
+    env_names = {name for name in template.names if name not in bound_args}
+    for value in bound_args.values():
+        for part in (parse_template(value) or ()) if isinstance(value, str) else ():
+            if not isinstance(part, str):
+                env_names.add(part.name)
+
+    return PlanStep(number, include_path, target, query, args, bound_args,
+                    content, {}, template, tuple(sorted(env_names)))
+
+def resolve_branches(steps):
+    """Resolve `branches: {outcome: stepId}` to forward step indexes.
+
+    Unknown ids and backward jumps are dropped so a plan can never loop.
+    """
+    index_by_id = {}
+    for index, step in enumerate(steps):
+        if step.content and 'id' in step.content:
+            index_by_id.setdefault(step.content['id'], index)
+
+    resolved = []
+    for index, step in enumerate(steps):
+        branches = {}
+        for outcome, target_id in ((step.content or {}).get('branches') or {}).items():
+            target = index_by_id.get(target_id)
+            if target is not None and target > index:
+                branches[outcome] = target
+        resolved.append(step._replace(branches=branches))
+    return resolved
+
+def compile_workflow(workflow_file, cache_dir=PLAN_CACHE_DIR):
+    """Compile a route and its includes into a WorkflowPlan.
+
+    Plans are stored on disk under `cache_dir` keyed by the content hash of
+    every contributing file, so an unchanged route is only parsed once.
+    Pass cache_dir=None to skip the disk cache.
+    """
+    sources = [stat_source(workflow_file)]
+    route_bytes = read_bytes(workflow_file)
+    workflow, entries = parse_route(route_bytes, workflow_file)
+    includes = [entry for entry in entries if isinstance(entry, yaml_loader.Include)]
+
+    # Step files are read (and, on a cache miss, parsed) on a thread pool as
+    # soon as the route is parsed; a file included twice is loaded once
+    paths = list(dict.fromkeys(include.path for include in includes))
+    with ThreadPoolExecutor(max_workers=max(1, min(PRELOAD_WORKERS, len(paths)))) as pool:
+        loaded = dict(zip(paths, pool.map(read_source, paths)))
+        include_bytes = []
+        for include in includes:
+            source, data = loaded[include.path]
+            sources.append(source)
+            include_bytes.append((include.path, data))
+
+        key = fingerprint(route_bytes, include_bytes)
+        plan = load_cached_plan(cache_dir, key)
+        if plan is not None:
+            return plan._replace(workflow_file=workflow_file, sources=tuple(sources))
+
+        parsed = dict(zip(paths, pool.map(parse_step, paths, (loaded[p][1] for p in paths))))
+
+    steps = []
+    for number, entry in enumerate(entries, 1):
+        if isinstance(entry, yaml_loader.Include):
+            entry.set_content(parsed[entry.path])
+            steps.append(compile_step(number, entry.path, entry.target, entry.query,
+                                      entry.args, entry.content))
+        else:
+            steps.append(compile_step(number, None, None, {}, {}, entry))
+
+    if workflow.get('branchFeature'):
+        steps = resolve_branches(steps)
+
+    # Context keys come from each step bound to its args; environment
+    # variables never name context keys, so none are consulted here
+    graph = build_step_graph([
+        step_context_keys(s.template.bind(s.bound_args, env={}) if s.content else None)
+        for s in steps
+    ])
+    add_branch_edges(graph, [s.branches for s in steps])
+    plan = WorkflowPlan(workflow_file, workflow, tuple(steps), tuple(graph),
+                        ContextLayout(graph), tuple(sources), key)
+    store_cached_plan(cache_dir, key, plan)
+    return plan
+
+def cache_file(cache_dir, key):
+    return os.path.join(cache_dir, key + '.pickle') if cache_dir else None
+
+def load_cached_plan(cache_dir, key):
+    cache_path = cache_file(cache_dir, key)
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None  # Corrupt or incompatible entry: recompile
+
+def store_cached_plan(cache_dir, key, plan):
+    cache_path = cache_file(cache_dir, key)
+    if not cache_path:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+_plans = {}
+
+def load_plan(workflow_file, cache_dir=PLAN_CACHE_DIR, check=True):
+    """Return the compiled plan for a route, compiling only when needed.
+
+    In-process hits are validated by stat'ing the contributing files;
+    pass check=False to trust the cached plan without touching the disk.
+    """
+    key = os.path.abspath(workflow_file)
+    plan = _plans.get(key)
+    if plan is not None and (not check or sources_unchanged(plan.sources)):
+        return plan
+
+    plan = compile_workflow(workflow_file, cache_dir)
+    _plans[key] = plan
+    return plan
+
+def clear_plan_cache():
+    """Drop all in-process plans (on-disk plans are left in place)"""
+    _plans.clear()
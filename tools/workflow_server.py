@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from http import HTTPStatus
+
+from report_cache import ReportCache
+from yaml_runner import SimpleWorkflowRunner
+
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+class RouteTable:
+    """Warm runners for every route file, keyed by (method, path)"""
+
+    def __init__(self, routes_dir='routes', parallel=False, report_cache=None):
+        self.parallel = parallel
+        self.report_cache = report_cache
+        self.routes = {}
+        self.load(routes_dir)
+
+    def load(self, routes_dir):
+        for route_file in sorted(glob.glob(os.path.join(routes_dir, '*.yaml'))):
+            runner = SimpleWorkflowRunner(route_file, verbose=False, report_cache=self.report_cache)
+            method = runner.workflow.get('method', '').upper()
+            path = runner.workflow.get('path')
+            if not method or not path:
+                print(f"⚠️  Skipping {route_file}: no path/method")
+                continue
+
+            key = (method, path)
+            if key in self.routes:
+                print(f"⚠️  Skipping {route_file}: {method} {path} already served by "
+                      f"{self.routes[key].workflow_file}")
+                continue
+            self.routes[key] = runner
+            print(f"   ✓ {method} {path} -> {route_file} ({len(runner.steps)} steps)")
+
+    def match(self, method, path):
+        """Return (runner, status) for a request line"""
+        runner = self.routes.get((method, path))
+        if runner:
+            return runner, HTTPStatus.OK
+        if any(route_path == path for _, route_path in self.routes):
+            return None, HTTPStatus.METHOD_NOT_ALLOWED
+        return None, HTTPStatus.NOT_FOUND
+
+    async def dispatch(self, method, path, body=b''):
+        runner, status = self.match(method, path)
+        if runner is None:
+            return status, {"message": status.phrase, "statusCode": status.value}
+
+        icid = request_icid(body)
+        if self.parallel:
+            result = await runner.run_workflow_parallel_async(icid=icid)
+        else:
+            result = await runner.run_workflow_async(icid=icid)
+        return HTTPStatus(result.get('statusCode', 200)), result
+
+def request_icid(body):
+    """Customer key for the report cache, taken from a JSON request body"""
+    if not body:
+        return None
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    return payload.get('icid') or payload.get('customerId')
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request; returns None on a closed connection"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_SIZE:
+        raise ValueError(f"Request body too large: {length} bytes")
+    body = await reader.readexactly(length) if length else b''
+    path = target.split('?', 1)[0]
+    return method.upper(), path, version, headers, body
+
+def write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+
+async def handle_connection(table, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError) as e:
+                write_response(writer, HTTPStatus.BAD_REQUEST,
+                               {"message": str(e), "statusCode": 400}, False)
+                break
+            if request is None:
+                break
+
+            method, path, version, headers, body = request
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+            try:
+                status, payload = await table.dispatch(method, path, body)
+            except Exception as e:
+                status = HTTPStatus.INTERNAL_SERVER_ERROR
+                payload = {"message": str(e), "statusCode": status.value}
+
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, routes_dir, parallel, report_cache=None):
+    started = time.perf_counter()
+    print(f"📚 Loading routes from {routes_dir}/")
+    table = RouteTable(routes_dir, parallel=parallel, report_cache=report_cache)
+    print(f"✅ {len(table.routes)} routes ready in {time.perf_counter() - started:.3f}s")
+
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(table, r, w), host, port)
+    print(f"🚀 Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve workflow routes from a warm process")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--routes', default='routes', help="directory of route files")
+    parser.add_argument('--parallel', action='store_true',
+                        help="run independent steps side by side")
+    parser.add_argument('--report-cache-ttl', type=float, default=None, metavar='SECONDS',
+                        help="serve previous reports from an in-memory cache with this TTL")
+    parser.add_argument('--report-cache-size', type=int, default=None,
+                        help="maximum number of cached reports")
+    parser.add_argument('--report-cache-dir', default=None,
+                        help="also persist cached reports in this directory")
+    args = parser.parse_args()
+
+    report_cache = None
+    if args.report_cache_ttl is not None:
+        options = {'ttl': args.report_cache_ttl, 'cache_dir': args.report_cache_dir}
+        if args.report_cache_size:
+            options['max_entries'] = args.report_cache_size
+        report_cache = ReportCache(**options)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.routes, args.parallel, report_cache))
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from urllib.parse import parse_qsl
+
+import yaml
+
+# Prefer the libyaml-backed loader; fall back to the pure-Python one
+try:
+    from yaml import CSafeLoader as BaseLoader
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as BaseLoader
+    LIBYAML = False
+
+class WorkflowLoader(BaseLoader):
+    """Safe loader for routes and steps, with the `!include` tag registered"""
+
+_UNLOADED = object()
+
+class Include:
+    """A step included from a route.
+
+    Built by the `!include` tag in both of its forms:
+
+        - !include steps/db/read_customer.yaml?table=...&resultContextKey=customerData
+        - !include file: steps/db/query_prev_report.yaml
+          args:
+            table: ...
+
+    `target` is the include as written, `path` the file, `query` the parsed
+    ?query parameters, `args` the args: block and `line` the route line it
+    came from. The step file itself is only read when `content` is first
+    accessed.
+    """
+
+    __slots__ = ('target', 'path', 'query', 'args', 'line', '_content')
+
+    def __init__(self, target, args=None, line=None):
+        self.target = target
+        self.line = line
+        path, _, query = target.partition('?')
+        self.path = path.strip()
+        self.query = dict(parse_qsl(query, keep_blank_values=True))
+        self.args = args or {}
+        self._content = _UNLOADED
+
+    @property
+    def loaded(self):
+        return self._content is not _UNLOADED
+
+    @property
+    def content(self):
+        """The parsed step file, or None when it is missing or empty"""
+        if self._content is _UNLOADED:
+            self._content = load_file(self.path) if os.path.exists(self.path) else None
+        return self._content
+
+    def set_content(self, content):
+        self._content = content
+
+    def __eq__(self, other):
+        return (isinstance(other, Include)
+                and (other.target, other.args) == (self.target, self.args))
+
+    def __hash__(self):
+        return hash(self.target)
+
+    def __repr__(self):
+        if self.args:
+            return f'Include({self.target!r}, args={self.args!r})'
+        return f'Include({self.target!r})'
+
+    def __getstate__(self):
+        content = self._content if self.loaded else None
+        return (self.target, self.path, self.query, self.args, self.line, self.loaded, content)
+
+    def __setstate__(self, state):
+        self.target, self.path, self.query, self.args, self.line, loaded, content = state
+        self._content = content if loaded else _UNLOADED
+
+def construct_include(loader, node):
+    """`!include path?query`"""
+    return Include(loader.construct_scalar(node).strip(), line=node.start_mark.line + 1)
+
+def construct_include_mapping(loader, node):
+    """`!include file: path` followed by optional sibling keys such as args:"""
+    target = None
+    extra = {}
+    for key_node, value_node in node.value:
+        if key_node.tag == '!include':
+            if loader.construct_scalar(key_node).strip() != 'file':
+                raise yaml.constructor.ConstructorError(
+                    None, None, "expected '!include file: <path>'", key_node.start_mark)
+            target = str(loader.construct_object(value_node, deep=True)).strip()
+        else:
+            key = loader.construct_object(key_node, deep=True)
+            extra[key] = loader.construct_object(value_node, deep=True)
+    return Include(target, extra.get('args'), line=node.start_mark.line + 1)
+
+def construct_map(loader, node):
+    for key_node, _ in node.value:
+        if key_node.tag == '!include':
+            return construct_include_mapping(loader, node)
+    return loader.construct_yaml_map(node)
+
+WorkflowLoader.add_constructor('!include', construct_include)
+WorkflowLoader.add_constructor('tag:yaml.org,2002:map', construct_map)
+
+class LoadStats:
+    """Cumulative YAML parse timings, safe to update from several threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.bytes = 0
+            self.seconds = 0.0
+            self.by_path = {}
+
+    def record(self, path, size, seconds):
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+            self.seconds += seconds
+            if path is not None:
+                calls, total = self.by_path.get(path, (0, 0.0))
+                self.by_path[path] = (calls + 1, total + seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "loader": BaseLoader.__name__,
+                "calls": self.calls,
+                "bytes": self.bytes,
+                "seconds": round(self.seconds, 6),
+                "byPath": {p: {"calls": c, "seconds": round(t, 6)}
+                           for p, (c, t) in sorted(self.by_path.items())},
+            }
+
+stats = LoadStats()
+
+def load(data, path=None):
+    """Parse YAML text or bytes with WorkflowLoader, recording the timing"""
+    started = time.perf_counter()
+    try:
+        return yaml.load(data, Loader=WorkflowLoader)
+    finally:
+        stats.record(path, len(data), time.perf_counter() - started)
+
+def load_file(path):
+    with open(path, 'rb') as f:
+        return load(f.read(), path)
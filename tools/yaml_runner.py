@@ -1,150 +1,333 @@
-import yaml
+import argparse
+import asyncio
 import json
 import time
 import os
-import re
+
+import yaml_loader
+from execution_context import ExecutionContext
+from report_cache import (PREVIOUS_REPORT_KEY, REPORT_QUERY_STEP, REPORT_SAVE_STEP, ReportCache,
+                          saved_record)
+from step_executors import create_executor, select_outputs
+from step_templates import bind_params
+from workflow_graph import execution_waves
+from workflow_plan import load_plan
 
 class SimpleWorkflowRunner:
-    def __init__(self, workflow_file):
+    def __init__(self, workflow_file, verbose=True, report_cache=None, env=None):
         self.workflow_file = workflow_file
+        self.verbose = verbose
+        self.report_cache = report_cache
+        self.env = os.environ if env is None else env
         self.workflow = {}
         self.steps = []
         self.parse_workflow()
+
+    def log(self, message):
+        """Print progress output unless running quietly"""
+        if self.verbose:
+            print(message)
         
     def parse_workflow(self):
-        """Parse workflow file manually to avoid YAML include issues"""
-        with open(self.workflow_file, 'r', encoding='utf-8') as file:
-            content = file.read()
-        
-        # Extract basic workflow info
-        lines = content.split('\n')
-        for line in lines:
-            line = line.strip()
-            if line.startswith('path:'):
-                self.workflow['path'] = line.split(':', 1)[1].strip()
-            elif line.startswith('method:'):
-                self.workflow['method'] = line.split(':', 1).strip()
-            elif 'message:' in line and 'response:' not in line:
-                message = line.split('message:', 1).strip().strip('"\'')
-                if 'response' not in self.workflow:
-                    self.workflow['response'] = {}
-                self.workflow['response']['message'] = message
-            elif 'statusCode:' in line:
-                status = line.split('statusCode:', 1)[1].strip()
-                if 'response' not in self.workflow:
-                    self.workflow['response'] = {}
-                self.workflow['response']['statusCode'] = int(status)
-        
-        # Find include statements using regex
-        include_pattern = r'- !include\s+([^\s]+)'
-        includes = re.findall(include_pattern, content)
-        
-        step_count = 1
-        for include_path in includes:
-            # Clean up include path
-            clean_path = include_path.strip()
-            if '?' in clean_path:
-                clean_path = clean_path.split('?')[0]
-            if clean_path.startswith('file:'):
-                clean_path = clean_path[5:].strip()
-            
-            step_info = {
-                'number': step_count,
-                'include_path': clean_path,
-                'original_path': include_path
-            }
-            self.steps.append(step_info)
-            step_count += 1
+        """Load the compiled plan for the workflow file (see workflow_plan)"""
+        self.plan = load_plan(self.workflow_file)
+        self.workflow = self.plan.workflow
+        self.steps = self.plan.steps
+        # Bound step content per step number, with the env values it used
+        self.bound_steps = {}
+        # Executors are set up once here; dispatch is by step position
+        layout = self.plan.layout
+        self.executors = [
+            create_executor(step.content, layout.reads[i], layout.writes[i]) if step.content else None
+            for i, step in enumerate(self.steps)
+        ]
+        barriers = [node.keys.barrier or node.keys.reads_all for node in self.plan.graph]
+        select_outputs(self.executors, layout, barriers)
+        self.report_query_steps = set()
+        self.report_save_steps = set()
+        for step, node in zip(self.steps, self.plan.graph):
+            name = (step.content or {}).get('name')
+            if name == REPORT_QUERY_STEP and PREVIOUS_REPORT_KEY in node.keys.writes:
+                self.report_query_steps.add(step.number)
+            elif name == REPORT_SAVE_STEP:
+                self.report_save_steps.add(step.number)
             
-    def run_workflow(self):
-        """Execute the workflow simulation"""
-        print(f"🚀 Starting workflow: {self.workflow.get('path', 'Unknown')}")
-        print(f"📝 Method: {self.workflow.get('method', 'Unknown')}")
-        print(f"🎯 Total Steps Found: {len(self.steps)}")
-        print("=" * 60)
-        
-        for step in self.steps:
-            self.execute_step(step)
+    def print_header(self):
+        self.log(f"🚀 Starting workflow: {self.workflow.get('path', 'Unknown')}")
+        self.log(f"📝 Method: {self.workflow.get('method', 'Unknown')}")
+        self.log(f"🎯 Total Steps Found: {len(self.steps)}")
+        self.log("=" * 60)
+
+    def next_index(self, index, outcome):
+        """Index of the step to run after `index` given its outcome"""
+        target = self.steps[index].branches.get(outcome)
+        if target is None:
+            return index + 1
+        self.log(f"   🔀 Branch {outcome} -> step {self.steps[target].number}, "
+                 f"skipping {target - index - 1} steps")
+        return target
+
+    def run_workflow(self, outcomes=None, icid=None):
+        """Execute the workflow simulation.
+
+        `outcomes` maps step ids to the outcome they report (e.g. True when
+        a previous report exists); steps with a matching `branches:` entry
+        jump forward to the target step. `icid` identifies the customer for
+        the previous-report cache.
+        """
+        self.print_header()
+
+        context = ExecutionContext(self.plan.layout)
+        executed = 0
+        index = 0
+        while index < len(self.steps):
+            outcome = self.execute_step(self.steps[index], context, outcomes, icid)
+            executed += 1
+            index = self.next_index(index, outcome)
             
-        return self.build_response()
-    
-    def execute_step(self, step_info):
-        """Execute individual step"""
-        step_number = step_info['number']
-        include_path = step_info['include_path']
-        
-        print(f"\n🔄 Step {step_number}: Processing")
-        print(f"   📁 File: {include_path}")
-        
-        if os.path.exists(include_path):
+        return self.build_response(executed, context)
+
+    async def run_workflow_async(self, outcomes=None, icid=None):
+        """Execute the workflow simulation on the running event loop.
+
+        Steps still run in order, but every simulated wait is awaited, so
+        many executions can share one process and one event loop.
+        """
+        self.print_header()
+
+        context = ExecutionContext(self.plan.layout)
+        executed = 0
+        index = 0
+        while index < len(self.steps):
+            outcome = await self.execute_step_async(self.steps[index], context, outcomes, icid)
+            executed += 1
+            index = self.next_index(index, outcome)
+
+        return self.build_response(executed, context)
+
+    async def run_workflow_parallel_async(self, outcomes=None, icid=None):
+        """Execute the workflow as a dependency graph.
+
+        Dependencies come from the context keys each step reads and writes
+        (see workflow_graph), so steps whose inputs are ready run side by
+        side instead of in list order. Steps a branch may skip wait for the
+        branch decision and are dropped when it jumps past them.
+
+        Each step runs against a snapshot of the context taken when it
+        starts, and its outputs are merged back when it finishes, so a
+        later writer of a key cannot change what an earlier reader sees.
+        """
+        self.print_header()
+
+        nodes = self.plan.graph
+        for wave_number, wave in enumerate(execution_waves(nodes), 1):
+            numbers = ', '.join(str(self.steps[i].number) for i in wave)
+            self.log(f"🧭 Wave {wave_number}: steps {numbers}")
+
+        started = [asyncio.Event() for _ in nodes]
+        finished = [asyncio.Event() for _ in nodes]
+        skipped = set()
+        context = ExecutionContext(self.plan.layout)
+
+        async def run_node(node):
+            for index in node.after:
+                await finished[index].wait()
+            for index in node.started:
+                await started[index].wait()
+            started[node.index].set()
             try:
-                # Load step file content
-                with open(include_path, 'r', encoding='utf-8') as f:
-                    step_content = yaml.safe_load(f)
-                
-                if step_content:
-                    self.simulate_step_execution(step_content)
-                else:
-                    print(f"   ⚠️  Empty step file")
-                    
-            except Exception as e:
-                print(f"   ❌ Error loading step: {e}")
-        else:
-            print(f"   ⚠️  File not found: {include_path}")
-            
-    def simulate_step_execution(self, step_content):
-        """Simulate step execution based on content"""
-        step_id = step_content.get('id', 'unknown')
-        step_name = step_content.get('name', 'unnamed')
-        step_type = step_content.get('type', 'generic')
-        step_desc = step_content.get('desc', 'No description')
-        
-        print(f"   🏷️  ID: {step_id}")
-        print(f"   📝 Name: {step_name}")
-        print(f"   🏗️  Type: {step_type}")
-        print(f"   📄 Description: {step_desc}")
-        
-        # Simulate execution based on type
-        if step_type == 'business':
-            print(f"   🔧 Executing business logic...")
-            time.sleep(0.5)
-            print(f"   ✅ Business logic completed")
-            
-        elif step_type == 'db':
-            print(f"   🗄️  Executing database operation...")
-            time.sleep(1.0)
-            print(f"   ✅ Database operation completed")
-            
-        elif step_type == 'vendor':
-            print(f"   🌐 Executing vendor API call...")
-            time.sleep(1.5)
-            print(f"   ✅ Vendor API call completed")
-            
-        else:
-            print(f"   ⚙️  Executing generic step...")
-            time.sleep(0.3)
-            print(f"   ✅ Generic step completed")
-            
-        # Check for branches
+                if node.index in skipped:
+                    return False
+                view = context.snapshot()
+                outcome = await self.execute_step_async(self.steps[node.index], view, outcomes, icid)
+                context.merge(view, self.plan.layout.writes[node.index])
+                skipped.update(range(node.index + 1, self.next_index(node.index, outcome)))
+                return True
+            finally:
+                finished[node.index].set()
+
+        ran = await asyncio.gather(*(run_node(node) for node in nodes))
+        return self.build_response(sum(ran), context)
+
+    def load_step(self, step):
+        """Return the step bound to its include params, or None when there
+        is nothing to run"""
+        self.log(f"\n🔄 Step {step.number}: Processing")
+        self.log(f"   📁 File: {step.include_path or '(inline)'}")
+
+        if step.content is None:
+            if os.path.exists(step.include_path):
+                self.log(f"   ⚠️  Empty step file")
+            else:
+                self.log(f"   ⚠️  File not found: {step.include_path}")
+            return None
+        return self.bind_step(step)
+
+    def bind_step(self, step):
+        """Step content bound to its merged include args.
+
+        The result is cached per step and reused until one of the
+        environment variables it depends on changes.
+        """
+        env_values = tuple(self.env.get(name) for name in step.env_names)
+        cached = self.bound_steps.get(step.number)
+        if cached is not None and cached[0] == env_values:
+            return cached[1]
+        content = step.template.bind(bind_params(step.bound_args, self.env), self.env)
+        self.bound_steps[step.number] = (env_values, content)
+        return content
+    
+    def reads_cached_report(self, step, icid):
+        """Whether the previous-report cache may answer this step"""
+        return (self.report_cache is not None and icid is not None
+                and step.number in self.report_query_steps)
+
+    def cached_report_outcome(self, context, icid, report):
+        """Answer a previous-report query with a report from the cache.
+
+        Returns True on a hit (the report exists, so its branch is taken)
+        after placing the report in the context, and None when the db step
+        has to run.
+        """
+        if report is None:
+            return None
+        context.set(self.plan.layout.index[PREVIOUS_REPORT_KEY], report)
+        self.log(f"   ⚡ Previous report for {icid} served from cache")
+        return True
+
+    def report_to_remember(self, step, step_content, context, icid, outcome):
+        """The report a later cache hit stands in for, or None.
+
+        A report the query step found is cached as the step returned it; a
+        saved vendor response is cached as the record the query would read
+        back, so a hit hands downstream steps the same data as a db hit.
+        """
+        if self.report_cache is None or icid is None:
+            return None
+        if step.number in self.report_query_steps:
+            return context.get_key(PREVIOUS_REPORT_KEY) if outcome is True else None
+        if step.number in self.report_save_steps:
+            return saved_record(step_content, context, self.report_projection())
+        return None
+
+    def report_projection(self):
+        """Fields the previous-report query reads (None for all of them)"""
+        for step in self.steps:
+            if step.number in self.report_query_steps:
+                params = self.bind_step(step).get('params') or {}
+                return (params.get('dbParams') or {}).get('projectionFields')
+        return None
+
+    def execute_step(self, step, context, outcomes=None, icid=None):
+        """Execute individual step and return its outcome"""
+        step_content = self.load_step(step)
+        if not step_content:
+            return None
+        outcome = None
+        if self.reads_cached_report(step, icid):
+            outcome = self.cached_report_outcome(context, icid, self.report_cache.get(icid))
+        if outcome is None:
+            outcome = self.run_step(step, step_content, context, outcomes)
+            report = self.report_to_remember(step, step_content, context, icid, outcome)
+            if report is not None:
+                self.report_cache.put(icid, report)
+        return outcome
+
+    async def execute_step_async(self, step, context, outcomes=None, icid=None):
+        """Execute individual step without blocking the event loop"""
+        step_content = self.load_step(step)
+        if not step_content:
+            return None
+        outcome = None
+        if self.reads_cached_report(step, icid):
+            report = await self.report_cache.get_async(icid)
+            outcome = self.cached_report_outcome(context, icid, report)
+        if outcome is None:
+            outcome = await self.run_step_async(step, step_content, context, outcomes)
+            report = self.report_to_remember(step, step_content, context, icid, outcome)
+            if report is not None:
+                await self.report_cache.put_async(icid, report)
+        return outcome
+
+    def describe_step(self, step_content):
+        """Print step details"""
+        self.log(f"   🏷️  ID: {step_content.get('id', 'unknown')}")
+        self.log(f"   📝 Name: {step_content.get('name', 'unnamed')}")
+        self.log(f"   🏗️  Type: {step_content.get('type', 'generic')}")
+        self.log(f"   📄 Description: {step_content.get('desc', 'No description')}")
+
+    def step_outcome(self, step_content, outcomes):
+        """Look up the simulated outcome of a step (None when not given)"""
         if 'branches' in step_content:
-            branches = step_content['branches']
-            print(f"   🔀 Branches configured: {branches}")
+            self.log(f"   🔀 Branches configured: {step_content['branches']}")
+        return (outcomes or {}).get(step_content.get('id'))
+            
+    def run_step(self, step, step_content, context, outcomes=None):
+        """Run a step with its registered executor and return its outcome"""
+        self.describe_step(step_content)
+        self.executors[step.number - 1].run(step_content, context, self.log)
+        return self.step_outcome(step_content, outcomes)
+
+    async def run_step_async(self, step, step_content, context, outcomes=None):
+        """Run a step with its registered executor on the event loop"""
+        self.describe_step(step_content)
+        await self.executors[step.number - 1].run_async(step_content, context, self.log)
+        return self.step_outcome(step_content, outcomes)
             
-    def build_response(self):
+    def build_response(self, executed, context):
         """Build final response"""
         response = self.workflow.get('response', {})
         return {
             "message": response.get('message', 'Workflow completed'),
             "statusCode": response.get('statusCode', 200),
             "executionTime": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "stepsExecuted": len(self.steps),
+            "stepsExecuted": executed,
+            "contextKeys": sorted(context.as_dict()),
             "workflowPath": self.workflow.get('path', 'Unknown'),
             "method": self.workflow.get('method', 'Unknown')
         }
 
+async def run_concurrent(runner, count, parallel=False, outcomes=None, icid=None):
+    """Drive `count` executions of one parsed workflow concurrently"""
+    run = runner.run_workflow_parallel_async if parallel else runner.run_workflow_async
+    return await asyncio.gather(*(run(outcomes, icid) for _ in range(count)))
+
+def parse_outcome(value):
+    """Parse an `--outcome stepId=true|false` argument"""
+    step_id, sep, outcome = value.partition('=')
+    if not sep or outcome.lower() not in ('true', 'false'):
+        raise argparse.ArgumentTypeError(f"expected STEP_ID=true|false, got {value!r}")
+    return step_id, outcome.lower() == 'true'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate a YAML workflow route")
+    parser.add_argument('workflow_file', nargs='?', default='routes/fetch_br.yaml')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="run steps on the asyncio executor")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="number of concurrent executions (implies --async)")
+    parser.add_argument('--parallel', action='store_true',
+                        help="run independent steps side by side (implies --async)")
+    parser.add_argument('--outcome', action='append', type=parse_outcome, default=[],
+                        metavar='STEP_ID=true|false',
+                        help="simulated step outcome used to follow branches")
+    parser.add_argument('--icid', help="customer icid used as the previous-report cache key")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="run the workflow this many times in one process")
+    parser.add_argument('--report-cache-ttl', type=float, default=None, metavar='SECONDS',
+                        help="enable the previous-report cache with this TTL")
+    parser.add_argument('--report-cache-dir', default=None,
+                        help="also persist cached reports in this directory")
+    parser.add_argument('--yaml-stats', action='store_true',
+                        help="print YAML parse timings")
+    return parser.parse_args()
+
 def main():
     """Main execution function"""
-    workflow_file = 'routes/fetch_br.yaml'
+    args = parse_args()
+    workflow_file = args.workflow_file
+    outcomes = dict(args.outcome)
     
     print("🚀 YAML Workflow Runner (Fixed Version)")
     print("=" * 60)
@@ -166,8 +349,33 @@ def main():
     
     try:
         # Create and run workflow
-        runner = SimpleWorkflowRunner(workflow_file)
-        result = runner.run_workflow()
+        report_cache = None
+        if args.report_cache_ttl is not None:
+            report_cache = ReportCache(ttl=args.report_cache_ttl, cache_dir=args.report_cache_dir)
+
+        for _ in range(args.repeat):
+            if args.concurrency > 1:
+                runner = SimpleWorkflowRunner(workflow_file, verbose=False, report_cache=report_cache)
+                started = time.perf_counter()
+                results = asyncio.run(run_concurrent(
+                    runner, args.concurrency, args.parallel, outcomes, args.icid))
+                elapsed = time.perf_counter() - started
+                result = results[-1]
+                print(f"⚡ {len(results)} concurrent executions in {elapsed:.2f}s")
+            elif args.parallel:
+                runner = SimpleWorkflowRunner(workflow_file, report_cache=report_cache)
+                result = asyncio.run(runner.run_workflow_parallel_async(outcomes, args.icid))
+            elif args.use_async:
+                runner = SimpleWorkflowRunner(workflow_file, report_cache=report_cache)
+                result = asyncio.run(runner.run_workflow_async(outcomes, args.icid))
+            else:
+                runner = SimpleWorkflowRunner(workflow_file, report_cache=report_cache)
+                result = runner.run_workflow(outcomes, args.icid)
+
+        if report_cache is not None:
+            print(f"🗃️  Report cache: {report_cache.stats()}")
+        if args.yaml_stats:
+            print(f"⏱️  YAML parsing: {json.dumps(yaml_loader.stats.snapshot(), indent=2)}")
         
         # Display results
         print('\n' + '=' * 60)